@@ -0,0 +1,126 @@
+'''
+Author - Abdulmuid Olaniyan
+Purpose - Vectorized spending analytics over the whole ledger with NumPy
+This module is heavy to import, app.py only loads it on the first analytics request.
+'''
+from collections import namedtuple
+
+import numpy as np
+
+# Typed layout rows are extracted into straight from the SQLite cursor
+LEDGER_DTYPE = np.dtype([("amount_cents", np.int64), ("category_id", np.int32), ("day", np.int32)])
+
+# Column arrays of a ledger: amounts in cents, category ids, days since 1970-01-01,
+# plus the {category id: name} lookup
+Ledger = namedtuple("Ledger", ["amount_cents", "category_ids", "days", "categories"])
+
+
+def load_ledger(db, category=None, start_date=None, end_date=None):
+    '''
+    Reads the (optionally filtered) transactions into NumPy column arrays.
+    Rows go from the cursor straight into a preallocated structured array with np.fromiter,
+    no list of tuples is built on the way.
+    '''
+    with db.ledger_columns(category, start_date, end_date) as (count, rows):
+        data = np.fromiter(rows, dtype=LEDGER_DTYPE, count=count)
+    return Ledger(data["amount_cents"], data["category_id"], data["day"], db.get_categories())
+
+
+def _group_sum(keys, values):
+    '''
+    Sums integer values per key; returns (sorted unique keys, int64 sums, counts).
+    Sorting and np.add.reduceat keep the sums in exact integer arithmetic.
+    '''
+    if len(keys) == 0:
+        return keys[:0], np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    starts = np.flatnonzero(np.concatenate(([True], sorted_keys[1:] != sorted_keys[:-1])))
+    sums = np.add.reduceat(values[order].astype(np.int64), starts)
+    counts = np.diff(np.append(starts, len(sorted_keys)))
+    return sorted_keys[starts], sums, counts
+
+
+def _months(days):
+    '''
+    Turns day numbers into month numbers (months since 1970-01)
+    '''
+    return days.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+
+
+def _month_label(month):
+    return str(np.datetime64(int(month), "M"))
+
+
+def monthly_totals(ledger):
+    '''
+    Returns [(month "YYYY-MM", total cents, transaction count)] in month order
+    '''
+    months, totals, counts = _group_sum(_months(ledger.days), ledger.amount_cents)
+    return [(_month_label(month), int(total), int(count)) for month, total, count in zip(months, totals, counts)]
+
+
+def category_breakdown(ledger):
+    '''
+    Returns [(category, total cents, transaction count, share of the overall total)], largest first
+    '''
+    category_ids, totals, counts = _group_sum(ledger.category_ids, ledger.amount_cents)
+    overall = int(totals.sum())
+    order = np.argsort(-totals, kind="stable")
+    return [(ledger.categories.get(int(category_ids[i]), str(category_ids[i])), int(totals[i]), int(counts[i]),
+             float(totals[i]) / overall if overall else 0.0) for i in order]
+
+
+def rolling_average(ledger, window=30):
+    '''
+    Returns [(day "YYYY-MM-DD", total cents that day, average daily cents over the last window days)]
+    for every day from the first to the last transaction, days without transactions included.
+    The first days average over the days available so far.
+    '''
+    if len(ledger.days) == 0:
+        return []
+    window = max(1, int(window))
+    first_day = int(ledger.days.min())
+    offsets = ledger.days - first_day
+    daily = np.zeros(int(offsets.max()) + 1, dtype=np.int64)
+    day_offsets, day_totals, _ = _group_sum(offsets, ledger.amount_cents)
+    daily[day_offsets] = day_totals
+
+    running = np.concatenate(([0], np.cumsum(daily)))
+    ends = np.arange(1, len(daily) + 1)
+    starts = np.maximum(ends - window, 0)
+    averages = (running[ends] - running[starts]) / (ends - starts)
+
+    labels = (np.arange(len(daily)) + first_day).astype("datetime64[D]").astype(str)
+    return list(zip(labels.tolist(), daily.tolist(), averages.tolist()))
+
+
+def budget_vs_actual(ledger, budgets):
+    '''
+    Compares spending with monthly budgets given as {category name: budget cents}.
+    Returns [(month "YYYY-MM", category, actual cents, budget cents, remaining cents)] for every
+    budgeted category in every month of the ledger.
+    '''
+    if len(ledger.days) == 0 or not budgets:
+        return []
+    ids_by_name = {name: category_id for category_id, name in ledger.categories.items()}
+    months = _months(ledger.days)
+    first_month = int(months.min())
+    month_count = int(months.max()) - first_month + 1
+
+    # One combined integer key per (month, category) so a single grouping pass does the work
+    category_count = max(ledger.categories, default=0) + 1
+    keys = (months - first_month) * category_count + ledger.category_ids
+    group_keys, group_totals, _ = _group_sum(keys, ledger.amount_cents)
+    actual = np.zeros(month_count * category_count, dtype=np.int64)
+    actual[group_keys] = group_totals
+    actual = actual.reshape(month_count, category_count)
+
+    report = []
+    for month_index in range(month_count):
+        label = _month_label(first_month + month_index)
+        for name, budget in budgets.items():
+            category_id = ids_by_name.get(name)
+            spent = int(actual[month_index, category_id]) if category_id is not None else 0
+            report.append((label, name, spent, int(budget), int(budget) - spent))
+    return report
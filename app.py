@@ -1,33 +1,130 @@
-import matplotlib.pyplot as plt
-import pandas as pd
-from io import BytesIO
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas 
-from flask import Flask, render_template, request, redirect, url_for, Response
-from database import Database_Manager
-
-app = Flask(__name__)
-db = Database_Manager()
-
-@app.route('/transactions', methods=['GET'])
+import click
+import os
+import tempfile
+import time
+from datetime import datetime, timezone
+from io import TextIOWrapper
+from flask import Flask, Blueprint, current_app, g, render_template, request, redirect, url_for, Response, abort, jsonify, send_file
+from werkzeug.http import is_resource_modified
+from chart_cache import Chart_Cache, chart_etag
+from database import Database_Manager, DEFAULT_PAGE_SIZE, Stale_Cursor_Error, amount_to_cents, fts_query
+from importer import import_transactions, DEFAULT_BATCH_SIZE, DEFAULT_OFX_CATEGORY
+from metrics import REGISTRY, RENDER_BYTES, RENDER_SECONDS, REQUEST_SECONDS, Sampling_Profiler
+
+# NumPy (analytics.py), matplotlib (charts.py) and reportlab (reports.py) are slow to import
+# and only needed by /api/analytics, /charts and /download_pdf, so they are imported inside
+# those routes on first use. Workers that only serve /transactions never load them.
+
+tracker = Blueprint('tracker', __name__, cli_group=None)
+
+
+def create_app(db_name=None):
+    '''
+    Builds the Flask app; the database path comes from the argument, the DATABASE
+    environment variable or defaults to database.db.
+    Nothing here opens a connection that outlives the call or starts a thread, so the app
+    can be created once and then forked into workers (e.g. gunicorn --preload).
+    Setting PROFILE_INTERVAL (seconds, e.g. 0.01) turns on the sampling profiler, whose
+    stacks are served on /debug/profile.
+    '''
+    app = Flask(__name__)
+    app.extensions["database"] = Database_Manager(db_name or os.environ.get("DATABASE", "database.db"))
+    app.extensions["chart_cache"] = Chart_Cache()
+    if os.environ.get("PROFILE_INTERVAL"):
+        app.extensions["profiler"] = Sampling_Profiler(float(os.environ["PROFILE_INTERVAL"]))
+    app.before_request(_start_request_timer)
+    app.after_request(_record_request)
+    app.teardown_request(_stop_request_profile)
+    app.register_blueprint(tracker)
+    return app
+
+
+def _start_request_timer():
+    '''
+    Notes when the request began and has the profiler sample this thread until the request
+    ends; the profiler thread is started by the first request of every worker, so it also
+    runs after a fork
+    '''
+    profiler = current_app.extensions.get("profiler")
+    if profiler is not None:
+        profiler.start()
+        profiler.track()
+    g.request_started = time.perf_counter()
+
+
+def _record_request(response):
+    '''
+    Adds the request to the latency histogram of its route. The route pattern (not the URL)
+    is the label, so the number of series stays small.
+    '''
+    started = g.pop("request_started", None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        REQUEST_SECONDS.observe(time.perf_counter() - started, route=route, method=request.method,
+                                status=response.status_code)
+    return response
+
+
+def _stop_request_profile(error=None):
+    '''
+    Stops sampling the request thread; teardown also runs when the request failed
+    '''
+    profiler = current_app.extensions.get("profiler")
+    if profiler is not None:
+        profiler.untrack()
+
+
+def get_db():
+    '''
+    Returns the Database_Manager of the current app
+    '''
+    return current_app.extensions["database"]
+
+
+def _render_chart(db, category, start_date, end_date, profiler=None):
+    '''
+    Renders the category chart; runs on a chart worker thread, which the profiler samples
+    only while it renders
+    '''
+    if profiler is not None:
+        profiler.track()
+    try:
+        from charts import render_category_chart  # Loads matplotlib on the first render only
+        return render_category_chart(db.get_category_totals(category, start_date, end_date))
+    finally:
+        if profiler is not None:
+            profiler.untrack()
+
+
+@tracker.route('/transactions', methods=['GET'])
 def show_transactions():
     '''
-    This function filters and shows transactions by category or by a date interval.
+    This function filters and shows transactions by category and/or a date interval, one page at a time.
+    With ?q= it searches the descriptions and shows the best matches first.
     '''
     category = request.args.get('category')  # Get category from URL (if provided)
     start_date = request.args.get('start_date')  # Get start date from URL
     end_date = request.args.get('end_date')  # Get end date from URL
+    after = request.args.get('after')  # Cursor token for the next (older) page
+    before = request.args.get('before')  # Cursor token for the previous (newer) page
+    page_size = request.args.get('page_size', DEFAULT_PAGE_SIZE, type=int)
+    search = request.args.get('q')  # Words to look for in the descriptions
 
-    if category:  # Filter by category
-        transactions = db.get_transactions_by_category(category)
-    elif start_date and end_date:  # Only filter by date if both are provided
-        transactions = db.get_transactions_by_date(start_date, end_date)
-    else:  
-        transactions = db.get_transactions()  # If no filters, show all transactions.
+    # Only one page is read from the database and rendered, no matter how big the ledger is
+    try:
+        page = get_db().get_transactions_page(page_size, after=after, before=before, category=category,
+                                              start_date=start_date, end_date=end_date, search=search)
+    except Stale_Cursor_Error:
+        abort(400, description="The transactions changed since this page was shown, run the search again")
+    except ValueError:
+        abort(400, description="Invalid page token")
 
-    return render_template('transactions.html', transactions=transactions)
+    # Search results (when the text has words to match) are in relevance order, not date order
+    ranked = bool(search and fts_query(search))
+    return render_template('transactions.html', transactions=page.rows,
+                           next_token=page.next_token, prev_token=page.prev_token, ranked=ranked)
 
-@app.route('/add_transaction', methods=['POST'])
+@tracker.route('/add_transaction', methods=['POST'])
 def add_transaction():
     '''
     This function adds a new transaction to the database.
@@ -42,114 +139,223 @@ def add_transaction():
         category = request.form["custom_category"]
 
     # Insert the new transaction into the database
-    db.insert_transactions(amount, category, description, date)
+    try:
+        get_db().insert_transactions(amount, category, description, date)
+    except ValueError as error:
+        abort(400, description=str(error))
 
     # Redirect back to the transaction list page
-    return redirect(url_for('show_transactions'))  # This will call show_transactions() to refresh the page
+    return redirect(url_for('tracker.show_transactions'))  # This will call show_transactions() to refresh the page
+
+@tracker.route('/import_transactions', methods=['POST'])
+def import_transactions_file():
+    '''
+    This function bulk imports an uploaded CSV or OFX bank statement.
+    The file is parsed as a stream and inserted in batches, the response reports
+    how many rows were accepted and rejected.
+    '''
+    upload = request.files.get("file")
+    if upload is None or not upload.filename:
+        abort(400, description="No file uploaded")
+
+    # Use the format from the form, otherwise guess it from the file extension
+    file_format = request.form.get("format") or upload.filename.rsplit(".", 1)[-1]
+    file_format = file_format.lower()
+    if file_format == "qfx":
+        file_format = "ofx"  # Quicken's QFX is OFX with a few extra tags
+    batch_size = request.form.get("batch_size", DEFAULT_BATCH_SIZE, type=int)
+    category = request.form.get("category") or DEFAULT_OFX_CATEGORY
+
+    # Decode the upload lazily instead of reading it into memory
+    stream = TextIOWrapper(upload.stream, encoding="utf-8-sig", errors="replace", newline="")
+    try:
+        result = import_transactions(get_db(), stream, file_format, batch_size, category)
+    except ValueError as error:
+        abort(400, description=str(error))
+
+    return jsonify(result.to_dict())
 
-@app.route('/charts')
+@tracker.route('/charts')
 def show_charts():
     '''
-    This function generates a bar chart of expenses by category.
-    It retrieves all transactions from the database.
-    It creates a bar chart and returns it as an image.
+    This function returns a bar chart of expenses by category as a PNG image.
+    The totals come from the (category, day) rollup, filtered by the category and date
+    interval in the URL. Rendered charts are cached per filter and data version, and the
+    response carries ETag/Last-Modified headers so browsers can revalidate with a 304.
     '''
-    # Get all transactions
-    transactions = db.get_transactions()
+    category = request.args.get('category') or ""  # Get category from URL (if provided)
+    start_date = request.args.get('start_date') or ""  # Get start date from URL
+    end_date = request.args.get('end_date') or ""  # Get end date from URL
 
-    # Convert transactions into a pandas DataFrame for easy manipulation
-    df = pd.DataFrame(transactions, columns=['id', 'amount', 'category', 'description', 'date'])
+    db = get_db()
 
-    # Group by category and sum the amounts
-    category_expenses = df.groupby('category')['amount'].sum()
+    # Every write bumps the data version, so a new version means a new chart
+    version, updated_at = db.get_data_version()
+    key = (category, start_date, end_date, version)
+    etag = chart_etag(key)
+    last_modified = datetime.fromtimestamp(updated_at, timezone.utc)
 
-    plt.figure(figsize=(10, 6))
-    category_expenses.plot(kind='bar', color='skyblue')
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response = Response(status=304)
+    else:
+        profiler = current_app.extensions.get("profiler")
+        png = current_app.extensions["chart_cache"].get(
+            key, lambda: _render_chart(db, category, start_date, end_date, profiler))
+        response = Response(png, mimetype='image/png')
 
-    plt.title('Expenses by Category', fontsize=14, fontweight='bold')
-    plt.xlabel('Category', fontsize=12)
-    plt.ylabel('Amount', fontsize=12)
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.no_cache = True  # Always revalidate, the data may have changed
+    return response
 
-    # Rotate the x-axis labels to prevent cropping
-    plt.xticks(rotation=30, ha='right')  
+@tracker.route('/charts/stats', methods=['GET'])
+def chart_stats():
+    '''
+    This function reports the chart cache hit rate and render times as JSON.
+    '''
+    return jsonify(current_app.extensions["chart_cache"].stats())
 
-    # Adjust layout to prevent text from getting cut off
-    plt.tight_layout()  
+@tracker.route('/metrics', methods=['GET'])
+def show_metrics():
+    '''
+    This function reports request latencies, database call timings and row counts, and
+    chart/PDF render times in the Prometheus text format.
+    '''
+    stats = current_app.extensions["chart_cache"].stats()
+    gauges = {
+        "finance_chart_cache_entries": ("Rendered charts held in the cache", stats["entries"]),
+        "finance_chart_cache_hit_ratio": ("Share of chart requests served from the cache", stats["hit_rate"]),
+    }
+    return Response(REGISTRY.render(gauges), content_type="text/plain; version=0.0.4; charset=utf-8")
 
-    # Grid lines for better readability
-    plt.grid(axis='y', linestyle='--', alpha=0.7)
+@tracker.route('/debug/profile', methods=['GET'])
+def show_profile():
+    '''
+    This function returns the stacks collected by the sampling profiler (PROFILE_INTERVAL)
+    in the collapsed format read by flamegraph.pl and speedscope.
+    '''
+    profiler = current_app.extensions.get("profiler")
+    if profiler is None:
+        abort(404)
+    limit = request.args.get('limit', 200, type=int)
+    return Response(profiler.collapsed(limit), mimetype='text/plain')
 
-    # Add value labels on top of bars
-    for i, value in enumerate(category_expenses):
-        plt.text(i, value + 1, str(round(value, 2)), ha='center', fontsize=10, fontweight='bold')
+@tracker.route('/api/summary', methods=['GET'])
+def summary():
+    '''
+    This function returns the total and number of transactions per category as JSON.
+    It accepts the same category and date interval filters as /charts.
+    '''
+    category = request.args.get('category')  # Get category from URL (if provided)
+    start_date = request.args.get('start_date')  # Get start date from URL
+    end_date = request.args.get('end_date')  # Get end date from URL
 
+    totals = get_db().get_category_totals(category, start_date, end_date)
+    return jsonify({
+        "categories": [{"category": name, "total": float(total), "count": count} for name, total, count in totals],
+        "total": float(sum(row[1] for row in totals)),
+        "count": sum(row[2] for row in totals),
+    })
 
-    # Save the plot to a BytesIO object and send it as a response
-    img = BytesIO()
-    plt.savefig(img, format='png')
-    img.seek(0)
-    plt.close()
-    
-    return Response(img, mimetype='image/png')
+@tracker.route('/api/analytics/<report>', methods=['GET'])
+def analytics_report(report):
+    '''
+    This function returns one of the vectorized analytics reports as JSON:
+    monthly, categories, rolling (?window=30) or budget (?budget=Food:300&budget=Rent:1200).
+    It accepts the same category and date interval filters as /transactions.
+    '''
+    import analytics  # Loads NumPy on the first analytics request only
 
-@app.route('/download_pdf', methods=['GET'])
+    category = request.args.get('category')  # Get category from URL (if provided)
+    start_date = request.args.get('start_date')  # Get start date from URL
+    end_date = request.args.get('end_date')  # Get end date from URL
+
+    budgets = {}
+    for budget in request.args.getlist('budget'):
+        name, _, amount = budget.rpartition(':')
+        try:
+            budgets[name] = amount_to_cents(amount)
+        except ValueError as error:
+            abort(400, description=str(error))
+
+    if report not in ('monthly', 'categories', 'rolling', 'budget'):
+        abort(404)
+    ledger = analytics.load_ledger(get_db(), category, start_date, end_date)
+
+    if report == 'monthly':
+        rows = [{"month": month, "total": total / 100, "count": count}
+                for month, total, count in analytics.monthly_totals(ledger)]
+    elif report == 'categories':
+        rows = [{"category": name, "total": total / 100, "count": count, "share": share}
+                for name, total, count, share in analytics.category_breakdown(ledger)]
+    elif report == 'rolling':
+        window = request.args.get('window', 30, type=int)
+        rows = [{"day": day, "total": total / 100, "average": average / 100}
+                for day, total, average in analytics.rolling_average(ledger, window)]
+    else:
+        rows = [{"month": month, "category": name, "actual": actual / 100, "budget": budget / 100,
+                 "remaining": remaining / 100}
+                for month, name, actual, budget, remaining in analytics.budget_vs_actual(ledger, budgets)]
+    return jsonify(rows)
+
+@tracker.route('/download_pdf', methods=['GET'])
 def download_pdf():
     '''
     This function generates a PDF of the transaction history.
+    Rows are streamed from the database in chunks into a paginated report that is spooled
+    to a temporary file, which is then streamed back as the download.
     '''
     category = request.args.get('category')  # Get category from URL (if provided)
     start_date = request.args.get('start_date')  # Get start date from URL
     end_date = request.args.get('end_date')  # Get end date from URL
 
-    if category:
-        transactions = db.get_transactions_by_category(category)
-    elif start_date and end_date:  # Only filter by date if both are provided
-        transactions = db.get_transactions_by_date(start_date, end_date)
-    else:
-        transactions = db.get_transactions()  # If no filters, show all transactions.
-
-    # Create a PDF in memory
-    pdf_buffer = BytesIO()
-    c = canvas.Canvas(pdf_buffer, pagesize=letter)
-    width, height = letter
-
-    # Add a title
-    c.setFont("Helvetica-Bold", 16)
-    c.drawString(200, height - 50, "Transaction History")
-
-    # Add the table headers
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(50, height - 100, "ID")
-    c.drawString(100, height - 100, "Amount")
-    c.drawString(200, height - 100, "Category")
-    c.drawString(350, height - 100, "Description")
-    c.drawString(500, height - 100, "Date")
-
-    # Add the transaction rows
-    c.setFont("Helvetica", 10)
-    y_position = height - 120
-    for transaction in transactions:
-        c.drawString(50, y_position, str(transaction[0]))
-        c.drawString(100, y_position, str(transaction[1]))
-        c.drawString(200, y_position, transaction[2])
-        c.drawString(350, y_position, transaction[3])
-        c.drawString(500, y_position, transaction[4])
-        y_position -= 20
-
-    # Save the PDF
-    c.save()
-
-    # Get the value of the PDF and return it as a download
-    pdf_buffer.seek(0)
-    return Response(pdf_buffer, mimetype='application/pdf', headers={
-        "Content-Disposition": "attachment; filename=transaction_history.pdf"
-    })
+    from reports import write_transaction_pdf  # Loads reportlab on the first export only
+
+    spool = tempfile.TemporaryFile()
+    started = time.perf_counter()
+    try:
+        write_transaction_pdf(get_db().iter_transactions(category, start_date, end_date), spool)
+    except BaseException:
+        spool.close()
+        raise
+    RENDER_SECONDS.observe(time.perf_counter() - started, kind="pdf")
+    RENDER_BYTES.inc(spool.tell(), kind="pdf")
+    spool.seek(0)
+
+    # send_file streams the file in blocks and closes it once the response is sent
+    return send_file(spool, mimetype='application/pdf', as_attachment=True,
+                     download_name='transaction_history.pdf')
+
+@tracker.cli.command('rebuild-rollup')
+def rebuild_rollup_command():
+    '''
+    Rebuilds the (category, day) rollup from the transactions table.
+    Usage: flask --app app rebuild-rollup
+    '''
+    get_db().rebuild_rollup()
+    click.echo("Rollup rebuilt.")
+
+@tracker.cli.command('check-rollup')
+def check_rollup_command():
+    '''
+    Checks the (category, day) rollup against the transactions table and exits with
+    status 1 if they disagree.
+    Usage: flask --app app check-rollup
+    '''
+    mismatches = get_db().check_rollup()
+    for category, day, raw_total, raw_count, rollup_total, rollup_count in mismatches:
+        click.echo(f"{category} {day}: transactions {raw_total} ({raw_count} rows), "
+                   f"rollup {rollup_total} ({rollup_count} rows)")
+    if mismatches:
+        raise SystemExit(1)
+    click.echo("Rollup is consistent.")
 
 # Navigate straight to the transaction homepage
-@app.route('/')
+@tracker.route('/')
 def home():
-    return redirect(url_for('show_transactions'))
+    return redirect(url_for('tracker.show_transactions'))
 
 
 if __name__ == "__main__":
-    app.run(debug=True, host="0.0.0.0", port=5000)
+    # Development server only, production runs wsgi.py under gunicorn (see the Dockerfile)
+    create_app().run(debug=True, host="0.0.0.0", port=5000)
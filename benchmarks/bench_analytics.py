@@ -0,0 +1,70 @@
+'''
+Benchmarks analytics.py over a large synthetic ledger: loading the columns into NumPy and
+each vectorized report, next to the row-by-row path (get_transactions() tuples summed in Python).
+
+Run from the project root:  python -m benchmarks.bench_analytics [--rows 1000000]
+'''
+import argparse
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict
+
+import analytics
+from database import Database_Manager
+
+CATEGORIES = ["Food", "Rent", "Entertainment", "Transport", "Utilities", "Health", "Travel", "Gifts"]
+BATCH_SIZE = 50_000
+
+
+def seed(db, rows):
+    '''
+    Inserts random transactions spread over three years, in large batches
+    '''
+    for start in range(0, rows, BATCH_SIZE):
+        db.insert_many((f"{random.randint(100, 50_000) / 100:.2f}", random.choice(CATEGORIES), "Card payment",
+                        f"{2023 + i % 3}-{i % 12 + 1:02d}-{i % 28 + 1:02d}")
+                       for i in range(start, min(start + BATCH_SIZE, rows)))
+
+
+def timed(label, function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    print(f"{label:<36} {time.perf_counter() - started:>8.3f} s")
+    return result
+
+
+def row_by_row_monthly(db):
+    '''
+    Monthly totals the old way: every row as a Python tuple, summed in a loop
+    '''
+    totals = defaultdict(int)
+    for _, amount, _, _, date in db.get_transactions():
+        totals[date[:7]] += amount
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        db = Database_Manager(os.path.join(workdir, "bench.db"))
+        timed(f"seed {args.rows} rows", seed, db, args.rows)
+
+        ledger = timed("load_ledger (np.fromiter)", analytics.load_ledger, db)
+        timed("monthly_totals", analytics.monthly_totals, ledger)
+        timed("category_breakdown", analytics.category_breakdown, ledger)
+        timed("rolling_average (30 days)", analytics.rolling_average, ledger, 30)
+        timed("budget_vs_actual", analytics.budget_vs_actual, ledger,
+              {name: 100_000 for name in CATEGORIES})
+        print(f"ledger arrays: {sum(array.nbytes for array in ledger[:3]) / 2**20:.1f} MiB")
+
+        timed("row-by-row monthly totals (old)", row_by_row_monthly, db)
+        db.close_db()
+
+
+if __name__ == "__main__":
+    main()
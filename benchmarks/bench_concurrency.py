@@ -0,0 +1,93 @@
+'''
+Load test for the pooled connection layer in database.py.
+Seeds a throwaway database, keeps a writer thread inserting in the background and measures
+how read throughput changes as more reader threads are added.
+
+Run from the project root:  python -m benchmarks.bench_concurrency [--rows 200000] [--seconds 3]
+'''
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+from database import Database_Manager
+
+CATEGORIES = ["Food", "Rent", "Entertainment", "Transport", "Utilities", "Health"]
+
+
+def seed(db, rows):
+    '''
+    Fills the database with random transactions spread over two years
+    '''
+    batch = []
+    for i in range(rows):
+        day = f"{2024 + i % 2}-{i % 12 + 1:02d}-{i % 28 + 1:02d}"
+        batch.append((round(random.uniform(1, 500), 2), random.choice(CATEGORIES), f"Purchase {i}", day))
+    db.insert_many(batch)
+
+
+def run(db, readers, seconds):
+    '''
+    Runs the given number of reader threads next to one writer for a fixed time.
+    Returns (reads per second, writes per second).
+    '''
+    stop = threading.Event()
+    reads = [0] * readers
+    writes = [0]
+    errors = []
+
+    def read_loop(slot):
+        try:
+            while not stop.is_set():
+                db.get_transactions_page(50, category=random.choice(CATEGORIES),
+                                         start_date="2024-03-01", end_date="2025-09-30")
+                reads[slot] += 1
+        except Exception as exc:  # Surface worker failures instead of silently losing them
+            errors.append(exc)
+
+    def write_loop():
+        try:
+            while not stop.is_set():
+                db.insert_transactions(12.5, random.choice(CATEGORIES), "Background write", "2025-06-15")
+                writes[0] += 1
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=read_loop, args=(slot,)) for slot in range(readers)]
+    threads.append(threading.Thread(target=write_loop))
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        raise errors[0]
+    return sum(reads) / seconds, writes[0] / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        db = Database_Manager(os.path.join(workdir, "bench.db"), max_readers=max(args.threads))
+        seed(db, args.rows)
+
+        print(f"{'readers':>8} {'reads/s':>10} {'speedup':>8} {'writes/s':>10}")
+        baseline = None
+        for readers in args.threads:
+            reads_per_sec, writes_per_sec = run(db, readers, args.seconds)
+            baseline = baseline or reads_per_sec
+            print(f"{readers:>8} {reads_per_sec:>10.0f} {reads_per_sec / baseline:>7.2f}x {writes_per_sec:>10.0f}")
+        db.close_db()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+'''
+Compares bulk import (importer.import_transactions, batched executemany) against the
+per-row insert path used by /add_transaction, in rows per second.
+
+Run from the project root:  python -m benchmarks.bench_import [--rows 100000] [--batch-size 1000]
+'''
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from database import Database_Manager
+from importer import import_transactions, validate_row, iter_csv_rows
+
+CATEGORIES = ["Food", "Rent", "Entertainment", "Transport", "Utilities", "Health"]
+
+
+def write_csv(path, rows):
+    '''
+    Writes a synthetic bank statement with the given number of rows
+    '''
+    with open(path, "w", newline="") as statement:
+        statement.write("date,amount,category,description\n")
+        for i in range(rows):
+            statement.write(f"2025-{i % 12 + 1:02d}-{i % 28 + 1:02d},{random.uniform(1, 500):.2f},"
+                            f"{random.choice(CATEGORIES)},Card payment {i}\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--per-row", type=int, default=10_000,
+                        help="rows pushed through the per-row path (it is much slower)")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "statement.csv")
+        write_csv(path, args.rows)
+
+        # Per-row path: one INSERT and one commit for every transaction
+        db = Database_Manager(os.path.join(workdir, "per_row.db"))
+        per_row = min(args.per_row, args.rows)
+        started = time.perf_counter()
+        with open(path, newline="") as statement:
+            for line, fields in iter_csv_rows(statement):
+                if line > per_row + 1:
+                    break
+                db.insert_transactions(*validate_row(fields))
+        per_row_rate = per_row / (time.perf_counter() - started)
+        db.close_db()
+
+        # Bulk path: batched executemany, one transaction per batch
+        db = Database_Manager(os.path.join(workdir, "bulk.db"))
+        started = time.perf_counter()
+        with open(path, newline="") as statement:
+            result = import_transactions(db, statement, "csv", args.batch_size)
+        bulk_rate = result.accepted / (time.perf_counter() - started)
+        db.close_db()
+
+    print(f"per-row insert: {per_row_rate:>10.0f} rows/s ({per_row} rows)")
+    print(f"bulk import:    {bulk_rate:>10.0f} rows/s ({result.accepted} rows, batch size {args.batch_size})")
+    print(f"speedup:        {bulk_rate / per_row_rate:>10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
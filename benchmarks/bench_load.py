@@ -0,0 +1,252 @@
+'''
+Synthetic-load regression suite. Builds reproducible ledgers (10k, 1M and 10M rows by default),
+drives /transactions, /charts, /download_pdf and /add_transaction through the Flask test client
+and reports throughput and p50/p99 latency for every scenario.
+Save a run with --save and check later runs against it with --compare: the script exits with
+status 1 when a p50 or p99 latency grows (or throughput drops) by more than --tolerance.
+
+Ledgers are generated from --seed, so every run sees the same data. With --cache-dir they are
+kept between runs and only built once (the 10M row ledger takes several minutes to build).
+
+Run from the project root:
+    python -m benchmarks.bench_load [--sizes 10000 1000000] [--requests 200] [--threads 1]
+                                    [--cache-dir .bench] [--save baseline.json]
+                                    [--compare baseline.json --tolerance 0.3]
+'''
+import argparse
+import json
+import math
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+from app import create_app
+from database import encode_cursor
+
+MERCHANTS = ["Uber trip", "Tesco groceries", "Amazon marketplace", "Netflix subscription", "Shell fuel",
+             "Starbucks coffee", "Rent transfer", "Spotify premium", "Boots pharmacy", "Trainline ticket"]
+CITIES = ["London", "Leeds", "Manchester", "Bristol", "Glasgow", "Cardiff"]
+CATEGORIES = ["Food", "Rent", "Entertainment", "Transport", "Utilities", "Health", "Travel", "Shopping"]
+SEARCHES = ["coffee", "uber london", "spotify", "tesco gro", "pharmacy leeds"]
+FIRST_DAY = date(2015, 1, 1)
+DAYS = 4018  # 2015-01-01 up to the end of 2025
+BATCH_SIZE = 50_000
+
+# Latency changes smaller than this are timer and scheduler noise, never a regression
+NOISE_FLOOR_MS = 5.0
+
+
+def seed(db, rows, seed_value):
+    '''
+    Inserts rows random transactions, the same ones for the same seed, in large batches
+    '''
+    rng = random.Random(seed_value)
+    for start in range(0, rows, BATCH_SIZE):
+        db.insert_many((f"{rng.randint(100, 50_000) / 100:.2f}", rng.choice(CATEGORIES),
+                        f"{rng.choice(MERCHANTS)} {rng.choice(CITIES)} #{i}",
+                        (FIRST_DAY + timedelta(days=rng.randrange(DAYS))).isoformat())
+                       for i in range(start, min(start + BATCH_SIZE, rows)))
+
+
+def random_month(rng):
+    '''
+    Returns the (first day, last day) of a random month of the ledger
+    '''
+    first = FIRST_DAY + timedelta(days=rng.randrange(DAYS))
+    first = first.replace(day=1)
+    last = (first + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    return first.isoformat(), last.isoformat()
+
+
+def transactions_first_page(client, rng):
+    category = rng.choice(CATEGORIES + [""])
+    return client.get("/transactions", query_string={"category": category})
+
+
+def transactions_deep_page(client, rng):
+    # A page somewhere in the middle of the ledger, as reached by following "Older" links
+    day = (FIRST_DAY + timedelta(days=rng.randrange(DAYS))).isoformat()
+    return client.get("/transactions", query_string={"after": encode_cursor(day, 2**62)})
+
+
+def transactions_search(client, rng):
+    return client.get("/transactions", query_string={"q": rng.choice(SEARCHES)})
+
+
+def charts(client, rng):
+    # A mix of repeated filters (cache hits) and new ones (renders)
+    start_date, end_date = random_month(random.Random(rng.randrange(20)))
+    return client.get("/charts", query_string={"start_date": start_date, "end_date": end_date})
+
+
+def download_pdf(client, rng):
+    # One category over one month keeps the report size independent of the ledger size
+    start_date, end_date = random_month(rng)
+    return client.get("/download_pdf", query_string={"category": rng.choice(CATEGORIES),
+                                                     "start_date": start_date, "end_date": end_date})
+
+
+def insert(client, rng):
+    return client.post("/add_transaction", data={
+        "amount": f"{rng.randint(100, 50_000) / 100:.2f}", "category": rng.choice(CATEGORIES),
+        "description": "Benchmark insert", "date": (FIRST_DAY + timedelta(days=rng.randrange(DAYS))).isoformat()})
+
+
+# (name, request function, expected status, share of --requests it runs); inserts go last
+# so every read scenario sees the ledger exactly as generated
+SCENARIOS = [
+    ("transactions", transactions_first_page, 200, 1.0),
+    ("transactions_deep", transactions_deep_page, 200, 1.0),
+    ("search", transactions_search, 200, 1.0),
+    ("charts", charts, 200, 1.0),
+    ("download_pdf", download_pdf, 200, 0.1),
+    ("insert", insert, 302, 1.0),
+]
+
+
+def percentile(samples, fraction):
+    '''
+    Nearest-rank percentile of already sorted samples
+    '''
+    return samples[max(0, math.ceil(fraction * len(samples)) - 1)]
+
+
+def run_scenario(app, function, status, requests, threads, seed_value):
+    '''
+    Sends requests requests from threads threads, each with its own test client.
+    Returns {"requests", "throughput" (requests per second), "p50_ms", "p99_ms"}.
+    '''
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def worker(index, count):
+        client = app.test_client()
+        rng = random.Random(seed_value * 1000 + index)
+        samples = []
+        for _ in range(count):
+            started = time.perf_counter()
+            response = function(client, rng)
+            response.get_data()  # Include the time to stream the body
+            samples.append((time.perf_counter() - started) * 1000)
+            response.close()
+            if response.status_code != status:
+                errors.append(response.status_code)
+        with lock:
+            latencies.extend(samples)
+
+    workers = [threading.Thread(target=worker, args=(i, requests // threads + (i < requests % threads)))
+               for i in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    if errors:
+        raise RuntimeError(f"unexpected status codes: {sorted(set(errors))}")
+
+    latencies.sort()
+    return {"requests": len(latencies), "throughput": len(latencies) / elapsed,
+            "p50_ms": percentile(latencies, 0.50), "p99_ms": percentile(latencies, 0.99)}
+
+
+def open_ledger(path, rows, seed_value):
+    '''
+    Returns an app over a ledger of rows transactions at path, generating it unless a
+    complete one from an earlier run is already there
+    '''
+    app = create_app(path)
+    db = app.extensions["database"]
+    with db._pool.reader() as connection:
+        existing = connection.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+    if existing != rows:
+        if existing:
+            raise SystemExit(f"{path} holds {existing} rows instead of {rows}, delete it first")
+        started = time.perf_counter()
+        seed(db, rows, seed_value)
+        print(f"generated {rows} rows in {time.perf_counter() - started:.1f} s")
+    return app
+
+
+def remove_inserts(db, rows):
+    '''
+    Deletes the rows added by the insert scenario so a cached ledger can be reused, then
+    empties the write-ahead log so the next run does not pay for checkpointing it
+    '''
+    with db._pool.writer() as connection:
+        connection.execute("DELETE FROM transactions WHERE id > (SELECT id FROM transactions ORDER BY id LIMIT 1 OFFSET ?)",
+                           (rows - 1,))
+    db.rebuild_rollup()
+    with db._pool.writer() as connection:
+        connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+def compare(results, baseline, tolerance):
+    '''
+    Returns a description of every scenario that got slower than the baseline by more than tolerance
+    '''
+    regressions = []
+    for size, scenarios in results.items():
+        for name, result in scenarios.items():
+            base = baseline.get(size, {}).get(name)
+            if base is None:
+                continue
+            for metric in ("p50_ms", "p99_ms"):
+                if result[metric] > base[metric] * (1 + tolerance) and result[metric] - base[metric] > NOISE_FLOOR_MS:
+                    regressions.append(f"{size} rows {name}: {metric} {base[metric]:.2f} -> {result[metric]:.2f}")
+            if result["throughput"] < base["throughput"] / (1 + tolerance):
+                regressions.append(f"{size} rows {name}: throughput {base['throughput']:.1f} -> {result['throughput']:.1f}/s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 1_000_000, 10_000_000])
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--threads", type=int, default=1, help="concurrent clients per scenario")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--cache-dir", help="keep the generated ledgers here between runs")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file written by an earlier --save")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="allowed slowdown, 0.3 = 30%%")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        directory = args.cache_dir or workdir
+        os.makedirs(directory, exist_ok=True)
+        for rows in args.sizes:
+            print(f"\n{rows} rows")
+            app = open_ledger(os.path.join(directory, f"ledger-{rows}-{args.seed}.db"), rows, args.seed)
+            print(f"{'scenario':<18} {'requests':>8} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9}")
+            results[str(rows)] = {}
+            for name, function, status, share in SCENARIOS:
+                requests = max(args.threads, round(args.requests * share))
+                result = run_scenario(app, function, status, requests, args.threads, args.seed)
+                results[str(rows)][name] = result
+                print(f"{name:<18} {result['requests']:>8} {result['throughput']:>9.1f} "
+                      f"{result['p50_ms']:>9.2f} {result['p99_ms']:>9.2f}")
+            db = app.extensions["database"]
+            if args.cache_dir:
+                remove_inserts(db, rows)
+            db.close_db()
+
+    if args.save:
+        with open(args.save, "w") as output:
+            json.dump(results, output, indent=2)
+    if args.compare:
+        with open(args.compare) as baseline:
+            regressions = compare(results, json.load(baseline), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            raise SystemExit(1)
+        print("\nno regressions")
+
+
+if __name__ == "__main__":
+    main()
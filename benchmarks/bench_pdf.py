@@ -0,0 +1,90 @@
+'''
+Measures wall time and peak Python memory of the PDF export for a large ledger.
+Compares the old approach (fetchall() into a single in-memory page built in a BytesIO)
+with reports.write_transaction_pdf() fed by Database_Manager.iter_transactions() and
+spooled to a temporary file.
+
+Run from the project root:  python -m benchmarks.bench_pdf [--rows 100000]
+'''
+import argparse
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from io import BytesIO
+
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+from database import Database_Manager
+from reports import write_transaction_pdf
+
+CATEGORIES = ["Food", "Rent", "Entertainment", "Transport", "Utilities", "Health"]
+
+
+def old_export(db):
+    '''
+    The export as it used to be: every row fetched at once and drawn in memory
+    '''
+    transactions = db.get_transactions()
+    pdf_buffer = BytesIO()
+    c = canvas.Canvas(pdf_buffer, pagesize=letter)
+    width, height = letter
+    y_position = height - 120
+    for transaction in transactions:
+        c.drawString(50, y_position, str(transaction[0]))
+        c.drawString(100, y_position, str(transaction[1]))
+        c.drawString(200, y_position, transaction[2])
+        c.drawString(350, y_position, transaction[3])
+        c.drawString(500, y_position, transaction[4])
+        y_position -= 20
+    c.save()
+    return pdf_buffer.getbuffer().nbytes
+
+
+def new_export(db):
+    '''
+    The paginated report streamed from the database into a temporary file
+    '''
+    with tempfile.TemporaryFile() as spool:
+        write_transaction_pdf(db.iter_transactions(), spool)
+        return spool.tell()
+
+
+def measure(label, export, db):
+    '''
+    Times one untraced run, then repeats it under tracemalloc for the peak memory
+    (tracing slows the export down too much to time it at the same run)
+    '''
+    started = time.perf_counter()
+    size = export(db)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    export(db)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<28} {elapsed:>8.2f} s {peak / 2**20:>10.1f} MiB peak {size / 2**20:>8.1f} MiB file")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--skip-old", action="store_true", help="only run the new export")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        db = Database_Manager(os.path.join(workdir, "bench.db"))
+        db.insert_many((round(random.uniform(1, 500), 2), random.choice(CATEGORIES), f"Card payment {i}",
+                        f"2025-{i % 12 + 1:02d}-{i % 28 + 1:02d}") for i in range(args.rows))
+
+        print(f"{args.rows} rows")
+        if not args.skip_old:
+            measure("old (fetchall + BytesIO)", old_export, db)
+        measure("new (chunked + spooled)", new_export, db)
+        db.close_db()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+'''
+Compares description search through the FTS5 index (Database_Manager.get_transactions_page
+with search=...) against the LIKE '%...%' scan it replaces, over a synthetic ledger.
+Ranked search scores every match, so its cost grows with the number of matches, while the
+LIKE scan walks the date index until it has a page, so its cost grows with the rows it has
+to read before finding 50 matches (the whole table for rare words).
+
+Run from the project root:  python -m benchmarks.bench_search [--rows 2000000] [--repeat 20]
+'''
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from database import Database_Manager, fts_query
+
+MERCHANTS = ["Uber trip", "Uber Eats order", "Lyft ride", "Tesco groceries", "Amazon marketplace", "Netflix subscription",
+             "Shell fuel", "Starbucks coffee", "Rent transfer", "Spotify premium", "Boots pharmacy", "Trainline ticket"]
+# Merchants that appear roughly once in every 10,000 transactions
+RARE_MERCHANTS = ["Eurostar booking", "IKEA furniture", "Dentist appointment"]
+CITIES = ["London", "Leeds", "Manchester", "Bristol", "Glasgow", "Cardiff", "Oxford", "Brighton"]
+CATEGORIES = ["Food", "Rent", "Entertainment", "Transport", "Utilities", "Health"]
+BATCH_SIZE = 50_000
+
+# From very selective to very common: a reference number, rare merchants, a two-word
+# search and single words that match a twelfth of the ledger or more
+SEARCHES = ["#1234567", "eurostar", "ikea furn", "dentist", "coffee london", "spotify", "uber", "ube", "nomatch"]
+
+
+def seed(db, rows):
+    '''
+    Inserts random transactions with merchant-like descriptions, in large batches
+    '''
+    for start in range(0, rows, BATCH_SIZE):
+        db.insert_many((f"{random.randint(100, 50_000) / 100:.2f}", random.choice(CATEGORIES),
+                        f"{random.choice(RARE_MERCHANTS if random.random() < 0.0003 else MERCHANTS)} "
+                        f"{random.choice(CITIES)} #{i}",
+                        f"{2020 + i % 6}-{i % 12 + 1:02d}-{i % 28 + 1:02d}")
+                       for i in range(start, min(start + BATCH_SIZE, rows)))
+
+
+def like_page(db, text, page_size=50):
+    '''
+    The baseline: a LIKE scan over every description, newest first
+    '''
+    conditions = " AND ".join("t.description LIKE ?" for _ in text.split())
+    query = f"""
+    SELECT t.id, t.amount_cents, c.name, t.description, t.date
+    FROM transactions AS t JOIN categories AS c ON c.id = t.category_id
+    WHERE {conditions} ORDER BY t.date DESC, t.id DESC LIMIT ?
+    """
+    with db._pool.reader() as connection:
+        return connection.execute(query, (*[f"%{word}%" for word in text.split()], page_size)).fetchall()
+
+
+def match_count(db, text):
+    '''
+    Number of transactions the search matches
+    '''
+    with db._pool.reader() as connection:
+        return connection.execute("SELECT COUNT(*) FROM transactions_fts WHERE transactions_fts MATCH ?",
+                                  (fts_query(text),)).fetchone()[0]
+
+
+def latency(function, repeat):
+    '''
+    Median wall time of repeat calls, in milliseconds
+    '''
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        db = Database_Manager(os.path.join(workdir, "bench.db"))
+        started = time.perf_counter()
+        seed(db, args.rows)
+        print(f"seeded {args.rows} rows in {time.perf_counter() - started:.1f} s")
+
+        print(f"{'search':<18} {'matches':>9} {'FTS5 ms':>10} {'LIKE ms':>10} {'speedup':>8}")
+        for text in SEARCHES:
+            fts_ms = latency(lambda: db.get_transactions_page(50, search=text), args.repeat)
+            # The baseline is slow, a few runs are enough for a stable median
+            like_ms = latency(lambda: like_page(db, text), max(1, args.repeat // 5))
+            print(f"{text:<18} {match_count(db, text):>9} {fts_ms:>10.2f} {like_ms:>10.2f} {like_ms / fts_ms:>7.1f}x")
+        db.close_db()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+'''
+Measures the cold start of a web worker: import time and resident memory of a fresh
+Python process that builds the app. "before" imports what app.py used to load at module
+level (matplotlib.pyplot, pandas, reportlab) on top of the app, "after" is the app as it
+is now, with the heavy modules loaded lazily.
+
+Run from the project root:  python -m benchmarks.bench_startup [--runs 5]
+'''
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# Runs inside a fresh interpreter, prints the import time and the process RSS as JSON
+CHILD = r"""
+import json, sys, time
+started = time.perf_counter()
+for module in sys.argv[2:]:
+    __import__(module)
+import app
+app.create_app(sys.argv[1])
+elapsed = time.perf_counter() - started
+with open("/proc/self/status") as status:
+    rss_kb = next(int(line.split()[1]) for line in status if line.startswith("VmRSS:"))
+print(json.dumps({"seconds": elapsed, "rss_mb": rss_kb / 1024, "heavy_loaded": "matplotlib" in sys.modules}))
+"""
+
+EAGER_MODULES = ["matplotlib.pyplot", "pandas", "reportlab.pdfgen.canvas", "reportlab.lib.pagesizes"]
+
+
+def measure(db_path, modules, runs):
+    '''
+    Starts runs fresh interpreters and returns the median import time and RSS
+    '''
+    results = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", CHILD, db_path, *modules], check=True,
+                                capture_output=True, text=True, cwd=os.getcwd()).stdout
+        results.append(json.loads(output))
+    return (statistics.median(result["seconds"] for result in results),
+            statistics.median(result["rss_mb"] for result in results),
+            results[0]["heavy_loaded"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    eager = []
+    for module in EAGER_MODULES:
+        # pandas is no longer a dependency, measure whatever of the old import list is installed
+        probe = subprocess.run([sys.executable, "-c", f"import {module}"], capture_output=True)
+        if probe.returncode == 0:
+            eager.append(module)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, "bench.db")
+        print(f"{'':<8} {'import s':>10} {'RSS MiB':>10}  heavy modules loaded")
+        for label, modules in (("before", eager), ("after", [])):
+            seconds, rss_mb, heavy_loaded = measure(db_path, modules, args.runs)
+            print(f"{label:<8} {seconds:>10.3f} {rss_mb:>10.1f}  {heavy_loaded}")
+        print(f"'before' imported: {', '.join(eager)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+'''
+Author - Abdulmuid Olaniyan
+Purpose - Caches rendered charts and renders them off the request thread
+'''
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import CHART_CACHE_LOOKUPS, RENDER_BYTES, RENDER_SECONDS
+
+# Number of threads that render charts, rendering is CPU bound so a couple is plenty
+RENDER_WORKERS = 2
+
+# Number of rendered charts kept in memory
+CACHE_SIZE = 128
+
+# Seconds a request waits for its chart before giving up
+RENDER_TIMEOUT = 30
+
+
+def chart_etag(key):
+    '''
+    Derives a stable ETag from a cache key
+    '''
+    return hashlib.sha1(repr(key).encode()).hexdigest()
+
+
+class Chart_Cache():
+    '''
+    LRU cache of rendered charts backed by a small pool of render threads.
+    Keys should include the data version so that new transactions produce new entries.
+    Concurrent requests for a chart that is still being rendered wait for the same render.
+    '''
+    def __init__(self, max_entries=CACHE_SIZE, workers=RENDER_WORKERS):
+        self._max_entries = max_entries
+        self._entries = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="chart-render")
+
+        self._hits = 0
+        self._misses = 0
+        self._renders = 0
+        self._render_seconds = 0.0
+        self._last_render_seconds = 0.0
+
+    def get(self, key, render, timeout=RENDER_TIMEOUT):
+        '''
+        Returns the PNG bytes cached under key, calling render() on a worker thread if they are missing
+        '''
+        with self._lock:
+            png = self._entries.get(key)
+            if png is not None:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                CHART_CACHE_LOOKUPS.inc(result="hit")
+                return png
+
+            future = self._pending.get(key)
+            if future is None:
+                self._misses += 1
+                CHART_CACHE_LOOKUPS.inc(result="miss")
+                future = self._executor.submit(self._render, key, render)
+                self._pending[key] = future
+            else:
+                # Someone else is already rendering this chart, share their result
+                self._hits += 1
+                CHART_CACHE_LOOKUPS.inc(result="hit")
+        return future.result(timeout)
+
+    def _render(self, key, render):
+        '''
+        Runs on a worker thread: renders one chart and stores it in the cache
+        '''
+        started = time.perf_counter()
+        try:
+            png = render()
+        except BaseException:
+            with self._lock:
+                self._pending.pop(key, None)
+            raise
+        elapsed = time.perf_counter() - started
+        RENDER_SECONDS.observe(elapsed, kind="chart")
+        RENDER_BYTES.inc(len(png), kind="chart")
+
+        with self._lock:
+            self._pending.pop(key, None)
+            self._entries[key] = png
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+            self._renders += 1
+            self._render_seconds += elapsed
+            self._last_render_seconds = elapsed
+        return png
+
+    def stats(self):
+        '''
+        Returns the cache hit rate and render timings
+        '''
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "renders": self._renders,
+                "render_seconds_total": self._render_seconds,
+                "render_seconds_avg": self._render_seconds / self._renders if self._renders else 0.0,
+                "render_seconds_last": self._last_render_seconds,
+            }
@@ -0,0 +1,52 @@
+'''
+Author - Abdulmuid Olaniyan
+Purpose - Renders the expense charts with matplotlib
+This module is heavy to import, app.py only loads it when the first chart is rendered.
+'''
+from io import BytesIO
+
+import matplotlib
+
+# Select the non-interactive Agg backend before anything else in matplotlib can pick one
+matplotlib.use("Agg")
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg  # noqa: E402
+from matplotlib.figure import Figure  # noqa: E402
+
+
+def render_category_chart(totals):
+    '''
+    Draws a bar chart of expenses by category from (category, total, count) rows and returns PNG bytes.
+    Uses the object-oriented Figure API with the Agg canvas, so no global pyplot state is
+    touched and several charts can be rendered at the same time.
+    '''
+    categories = [row[0] for row in totals]
+    category_expenses = [float(row[1]) for row in totals]
+
+    figure = Figure(figsize=(10, 6))
+    FigureCanvasAgg(figure)
+    axes = figure.add_subplot()
+    axes.bar(categories, category_expenses, color='skyblue')
+
+    axes.set_title('Expenses by Category', fontsize=14, fontweight='bold')
+    axes.set_xlabel('Category', fontsize=12)
+    axes.set_ylabel('Amount', fontsize=12)
+
+    # Rotate the x-axis labels to prevent cropping
+    axes.tick_params(axis='x', labelrotation=30)
+    for label in axes.get_xticklabels():
+        label.set_horizontalalignment('right')
+
+    # Grid lines for better readability
+    axes.grid(axis='y', linestyle='--', alpha=0.7)
+
+    # Add value labels on top of bars
+    for i, value in enumerate(category_expenses):
+        axes.text(i, value + 1, f"{value:.2f}", ha='center', fontsize=10, fontweight='bold')
+
+    # Adjust layout to prevent text from getting cut off
+    figure.tight_layout()
+
+    img = BytesIO()
+    figure.savefig(img, format='png')
+    return img.getvalue()
@@ -2,17 +2,293 @@
 Author - Abdulmuid Olaniyan
 Purpose - A database that stores every transaction information
 '''
+import datetime
+import os
+import queue
+import re
 import sqlite3
+import threading
+import weakref
+from collections import namedtuple
+from contextlib import contextmanager
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+from metrics import timed_query
+
+# Number of rows shown on one page of /transactions unless the caller asks otherwise
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Rows pulled from SQLite per fetchmany() call when streaming a large result
+DEFAULT_CHUNK_SIZE = 1000
+
+# An amount written with comma thousands separators, e.g. -1,234,567.89
+THOUSANDS_AMOUNT = re.compile(r"-?\d{1,3}(,\d{3})+(\.\d+)?")
+
+# One page of transactions plus the cursor tokens needed to reach its neighbours
+Transaction_Page = namedtuple("Transaction_Page", ["rows", "next_token", "prev_token"])
+
+
+class Stale_Cursor_Error(ValueError):
+    '''
+    A search page token was handed out before the last write, the ranking it refers to is gone
+    '''
+
+
+def encode_cursor(key, row_id):
+    '''
+    Turns the sort key and id of a row into an opaque cursor token of the form "key|id".
+    Search pages use the data version and a row offset in the same form.
+    '''
+    return f"{key}|{row_id}"
+
+
+def decode_cursor(token):
+    '''
+    Splits a cursor token back into its (key, id) keyset; raises ValueError if malformed
+    '''
+    key, _, row_id = token.rpartition("|")
+    if not key:
+        raise ValueError(f"Invalid cursor token: {token!r}")
+    row_id = int(row_id)
+    # Ids are SQLite 64-bit integers, anything bigger cannot be bound as a parameter
+    if not -2**63 <= row_id < 2**63:
+        raise ValueError(f"Invalid cursor token: {token!r}")
+    return key, row_id
+
+
+def fts_query(text):
+    '''
+    Turns free text typed by a user into an FTS5 query: every word must match, and the
+    last letters may be missing ("ube" finds "Uber"). Returns None if there are no words.
+    Words are quoted, so FTS5 operators in the text are treated as plain words.
+    '''
+    words = re.findall(r"\w+", text)
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def amount_to_cents(amount):
+    '''
+    Converts an amount (number or numeric string) to integer cents, rounding half up;
+    raises ValueError if it is not a finite number.
+    Commas are only accepted as thousands separators ("1,234.50"), a decimal comma
+    ("12,50") is rejected rather than read as 1250.
+    '''
+    text = str(amount).strip()
+    if "," in text:
+        if not THOUSANDS_AMOUNT.fullmatch(text):
+            raise ValueError(f"invalid amount {amount!r}")
+        text = text.replace(",", "")
+    try:
+        value = Decimal(text)
+    except InvalidOperation:
+        raise ValueError(f"invalid amount {amount!r}") from None
+    if not value.is_finite():
+        raise ValueError(f"invalid amount {amount!r}")
+    # Checked before rounding, huge values would overflow the Decimal context
+    cents = value * 100
+    if abs(cents) >= 2**63 - 1:
+        raise ValueError(f"amount out of range {amount!r}")
+    return int(cents.quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def cents_to_amount(cents):
+    '''
+    Converts integer cents back to an exact Decimal amount, e.g. 1250 -> Decimal("12.50")
+    '''
+    return Decimal(cents).scaleb(-2)
+
+
+def parse_date(value):
+    '''
+    Validates a date in YYYY-MM-DD (or OFX's YYYYMMDD[HHMMSS...]) form and returns it as YYYY-MM-DD
+    '''
+    value = str(value).strip()
+    try:
+        if re.fullmatch(r"\d{8}.*", value):
+            return datetime.datetime.strptime(value[:8], "%Y%m%d").date().isoformat()
+        return datetime.date.fromisoformat(value).isoformat()
+    except ValueError:
+        raise ValueError(f"invalid date {value!r}") from None
+
+
+def filter_conditions(category=None, start_date=None, end_date=None, date_column="date",
+                      category_column="category_id"):
+    '''
+    Builds the WHERE conditions and parameters shared by the filtered queries; empty filters are skipped.
+    The category is given by name and looked up in the categories table.
+    '''
+    conditions = []
+    params = []
+    if category:
+        conditions.append(f"{category_column} = (SELECT id FROM categories WHERE name = ?)")
+        params.append(category)
+    if start_date:
+        conditions.append(f"{date_column} >= ?")
+        params.append(start_date)
+    if end_date:
+        conditions.append(f"{date_column} <= ?")
+        params.append(end_date)
+    return conditions, params
+
+
+# Upper bound on concurrently checked out read connections
+DEFAULT_MAX_READERS = 8
+
+# How long (in milliseconds) a connection waits on a locked database before giving up
+DEFAULT_BUSY_TIMEOUT_MS = 5000
+
+
+# Every live pool, so a forked child can make them all start over
+_POOLS = weakref.WeakSet()
+
+# Connections a forked child inherited. SQLite forbids using them in the child, closing
+# included, so they are kept referenced here and never touched again.
+_INHERITED_CONNECTIONS = []
+
+
+def _reset_pools_after_fork():
+    for pool in list(_POOLS):
+        pool._after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_pools_after_fork)
+
+
+class Connection_Pool():
+    '''
+    Hands out SQLite connections to request threads.
+    Reads get their own connection from a pool of read-only connections, so concurrent
+    requests never share a cursor. Writes all go through one writer connection guarded by
+    a lock, which matches SQLite's single-writer model. WAL mode lets the readers keep
+    reading while the writer commits.
+    The pool needs an on-disk database, every ":memory:" connection would be a separate database.
+    '''
+    def __init__(self, db_name, max_readers=DEFAULT_MAX_READERS, busy_timeout_ms=DEFAULT_BUSY_TIMEOUT_MS):
+        self._db_name = db_name
+        self._busy_timeout_ms = busy_timeout_ms
+        self._max_readers = max_readers
+        self._reset()
+        _POOLS.add(self)
+
+    def _reset(self):
+        '''
+        Starts over with no open connections
+        '''
+        self._idle_readers = queue.LifoQueue()
+        self._reader_slots = threading.BoundedSemaphore(self._max_readers)
+        self._write_lock = threading.Lock()
+        self._writer = None
+
+    def _after_fork(self):
+        '''
+        Runs in a forked child (e.g. a gunicorn --preload worker) while it has a single thread.
+        SQLite connections must not be shared with a child, so it opens its own; any it
+        inherited are set aside without being closed. The queue's list is read directly
+        because another thread of the parent may have held its lock at fork time.
+        '''
+        if self._writer is not None:
+            _INHERITED_CONNECTIONS.append(self._writer)
+        _INHERITED_CONNECTIONS.extend(self._idle_readers.queue)
+        self._reset()
+
+    def _connect(self, read_only):
+        '''
+        Opens a new connection and applies the pragmas every connection needs
+        '''
+        connection = sqlite3.connect(self._db_name, timeout=self._busy_timeout_ms / 1000,
+                                     check_same_thread=False)
+        connection.execute(f"PRAGMA busy_timeout = {int(self._busy_timeout_ms)}")
+        # NORMAL is durable across application crashes in WAL mode and avoids an fsync per commit
+        connection.execute("PRAGMA synchronous = NORMAL")
+        connection.execute("PRAGMA temp_store = MEMORY")
+        if read_only:
+            connection.execute("PRAGMA query_only = ON")
+        else:
+            # The journal mode is stored in the database file, so setting it once is enough
+            connection.execute("PRAGMA journal_mode = WAL")
+        return connection
+
+    @contextmanager
+    def reader(self):
+        '''
+        Checks out a read-only connection for the duration of the with block
+        '''
+        self._reader_slots.acquire()
+        try:
+            try:
+                connection = self._idle_readers.get_nowait()
+            except queue.Empty:
+                connection = self._connect(read_only=True)
+            try:
+                yield connection
+            finally:
+                self._idle_readers.put(connection)
+        finally:
+            self._reader_slots.release()
+
+    @contextmanager
+    def writer(self):
+        '''
+        Gives exclusive use of the writer connection; the work done inside the with block is
+        committed as one transaction, or rolled back if it raises
+        '''
+        with self._write_lock:
+            if self._writer is None:
+                self._writer = self._connect(read_only=False)
+            connection = self._writer
+            try:
+                yield connection
+                connection.commit()
+            except BaseException:
+                connection.rollback()
+                raise
+
+    def close(self):
+        '''
+        Closes the writer and every idle read connection
+        '''
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        while True:
+            try:
+                self._idle_readers.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+# Columns of a transaction row as handed out by Database_Manager: (id, amount, category, description, date)
+TRANSACTION_SELECT = """
+SELECT t.id, t.amount_cents, c.name, t.description, t.date
+FROM transactions AS t JOIN categories AS c ON c.id = t.category_id
+"""
+
+
+def _to_transaction(row):
+    '''
+    Turns a stored row into (id, amount, category, description, date) with the amount as a Decimal
+    '''
+    row_id, amount_cents, category, description, date = row
+    return row_id, cents_to_amount(amount_cents), category, description, date
+
 
 class Database_Manager():
-    def __init__(self, db_name="database.db"):
+    def __init__(self, db_name="database.db", max_readers=DEFAULT_MAX_READERS):
         '''
-        Initialize the database connection
+        Initialize the connection pool; it is safe to share one instance between request threads
         '''
         self._db_name = db_name
-        self._connection = sqlite3.connect(self._db_name, check_same_thread=False)
-        self._cursor = self._connection.cursor() 
+        self._pool = Connection_Pool(self._db_name, max_readers=max_readers)
+        # Category ids never change once committed, so name -> id lookups are cached
+        self._category_ids = {}
         self.create_table()
+        # Nothing stays open, so the manager can be created before forking into workers
+        self._pool.close()
 
     def create_table(self):
         '''
@@ -20,61 +296,501 @@ class Database_Manager():
         Implements a SQL command that tells SQLite to create the table
         '''    
         #id serves as a unique identifier for each row and will increment(e.g. 1, 2, 3...)
-        #REAL for amount will allow decimal inputs and NULL doesn't allow an empty field
-        #category to store whatever the money was used for as a string   
+        #amounts are stored as whole cents in an INTEGER so sums are exact, NULL doesn't allow an empty field
+        #category_id points at the category name in the categories table
         #description is optional
         #dates will be stored as a string
         query = """
         CREATE TABLE IF NOT EXISTS transactions(
         id INTEGER PRIMARY KEY AUTOINCREMENT,
-        amount REAL NOT NULL,
-        category TEXT NOT NULL,
+        amount_cents INTEGER NOT NULL,
+        category_id INTEGER NOT NULL REFERENCES categories(id),
         description TEXT,
         date TEXT NOT NULL
         )
         """
-        self._cursor.execute(query)
-        self._connection.commit()
+        with self._pool.writer() as connection:
+            # Take the write lock up front so the schema setup (and any migration) is atomic,
+            # and so several worker processes starting together run it one after another
+            connection.execute("BEGIN IMMEDIATE")
+
+            # Every category name is stored once and referenced by a small integer
+            connection.execute("""
+            CREATE TABLE IF NOT EXISTS categories(
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
+            )
+            """)
+
+            columns = [column[1] for column in connection.execute("PRAGMA table_info(transactions)")]
+            if "amount" in columns:
+                self._migrate_to_cents(connection)
+            connection.execute(query)
+
+            # Indexes let the date and category filters (and the (date, id) keyset used for
+            # pagination) run as index range scans instead of full table scans.
+            # (category_id, date, id) also serves category-only lookups, a separate
+            # category_id index would only make every insert slower.
+            connection.execute("CREATE INDEX IF NOT EXISTS idx_transactions_date ON transactions(date, id)")
+            connection.execute("CREATE INDEX IF NOT EXISTS idx_transactions_category_date ON transactions(category_id, date, id)")
+            connection.execute("DROP INDEX IF EXISTS idx_transactions_category")
+
+            # Running totals per (category, day), kept up to date by every insert so that
+            # charts and summaries never have to scan the transactions table
+            rollup_exists = connection.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'category_daily_totals'").fetchone()
+            connection.execute("""
+            CREATE TABLE IF NOT EXISTS category_daily_totals(
+            category_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            total_cents INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (category_id, day)
+            ) WITHOUT ROWID
+            """)
+            connection.execute("CREATE INDEX IF NOT EXISTS idx_category_daily_totals_day ON category_daily_totals(day)")
+
+            # Databases created before the rollup existed are backfilled once
+            if not rollup_exists:
+                self._rebuild_rollup(connection)
+
+            # Full-text index over the descriptions. It stores no text of its own (the rows are
+            # read from transactions), triggers keep it in sync and the prefix indexes make
+            # prefix searches ("ube*") cheap.
+            search_exists = connection.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'transactions_fts'").fetchone()
+            connection.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS transactions_fts USING fts5(
+            description,
+            content = 'transactions',
+            content_rowid = 'id',
+            prefix = '2 3'
+            )
+            """)
+            connection.execute("""
+            CREATE TRIGGER IF NOT EXISTS transactions_fts_insert AFTER INSERT ON transactions BEGIN
+                INSERT INTO transactions_fts(rowid, description) VALUES (new.id, new.description);
+            END
+            """)
+            connection.execute("""
+            CREATE TRIGGER IF NOT EXISTS transactions_fts_delete AFTER DELETE ON transactions BEGIN
+                INSERT INTO transactions_fts(transactions_fts, rowid, description) VALUES ('delete', old.id, old.description);
+            END
+            """)
+            connection.execute("""
+            CREATE TRIGGER IF NOT EXISTS transactions_fts_update AFTER UPDATE OF description ON transactions BEGIN
+                INSERT INTO transactions_fts(transactions_fts, rowid, description) VALUES ('delete', old.id, old.description);
+                INSERT INTO transactions_fts(rowid, description) VALUES (new.id, new.description);
+            END
+            """)
+
+            # Databases created before the search index existed are indexed once
+            if not search_exists:
+                connection.execute("INSERT INTO transactions_fts(transactions_fts) VALUES ('rebuild')")
+
+            # A single-row counter that every write bumps, caches key on it to notice new data.
+            # It lives in the database so that all worker processes see the same value.
+            connection.execute("""
+            CREATE TABLE IF NOT EXISTS data_version(
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL,
+            updated_at INTEGER NOT NULL
+            )
+            """)
+            connection.execute("INSERT OR IGNORE INTO data_version(id, version, updated_at) VALUES (1, 0, strftime('%s', 'now'))")
+
+    def _migrate_to_cents(self, connection):
+        '''
+        Converts a transactions table from the original layout (REAL amount, TEXT category)
+        to integer cents and category ids, keeping every row id. Runs inside the caller's
+        transaction, so a row that cannot be converted leaves the database untouched.
+        '''
+        connection.execute("INSERT OR IGNORE INTO categories(name) SELECT DISTINCT category FROM transactions ORDER BY category")
+        for index in ("idx_transactions_date", "idx_transactions_category", "idx_transactions_category_date"):
+            connection.execute(f"DROP INDEX IF EXISTS {index}")
+        # The old rollup is keyed by category name, it is rebuilt from the converted rows
+        connection.execute("DROP TABLE IF EXISTS category_daily_totals")
+        connection.execute("ALTER TABLE transactions RENAME TO transactions_real")
+        connection.execute("""
+        CREATE TABLE transactions(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        amount_cents INTEGER NOT NULL,
+        category_id INTEGER NOT NULL REFERENCES categories(id),
+        description TEXT,
+        date TEXT NOT NULL
+        )
+        """)
+
+        def converted_rows():
+            # Amounts are converted in Python through their decimal text, SQLite's ROUND would
+            # turn e.g. 0.285 (stored as 0.28499999...) into 28 cents instead of 29
+            old_rows = connection.execute("""
+            SELECT t.id, t.amount, c.id, t.description, t.date
+            FROM transactions_real AS t JOIN categories AS c ON c.name = t.category
+            """)
+            for row_id, amount, category_id, description, date in old_rows:
+                try:
+                    amount_cents = amount_to_cents(amount)
+                except ValueError as error:
+                    raise ValueError(f"Cannot migrate transaction {row_id}: {error}") from None
+                yield row_id, amount_cents, category_id, description, date
+
+        connection.executemany("INSERT INTO transactions(id, amount_cents, category_id, description, date) VALUES (?, ?, ?, ?, ?)",
+                               converted_rows())
+        connection.execute("DROP TABLE transactions_real")
+
+    def _resolve_categories(self, connection, names):
+        '''
+        Returns {name: id} for the given category names, adding the ones that are new.
+        The second value holds the ids that are not cached yet; the caller caches them once
+        its transaction has committed.
+        '''
+        ids = {}
+        new_ids = {}
+        for name in set(names):
+            category_id = self._category_ids.get(name)
+            if category_id is None:
+                connection.execute("INSERT OR IGNORE INTO categories(name) VALUES (?)", (name,))
+                category_id = connection.execute("SELECT id FROM categories WHERE name = ?", (name,)).fetchone()[0]
+                new_ids[name] = category_id
+            ids[name] = category_id
+        return ids, new_ids
 
     def insert_transactions(self, amount, category, description, date):
         '''
-        Inserts a new transaction into the database
+        Inserts a new transaction into the database; raises ValueError if the amount is not a
+        number or the date is not a YYYY-MM-DD date
         '''    
-        query = "INSERT INTO transactions(amount, category, description, date) VALUES (?, ?, ?, ?)"
-        self._cursor.execute(query, (amount, category, description, date))
-        self._connection.commit()
+        self.insert_many([(amount, category, description, date)])
+
+    def insert_many(self, rows):
+        '''
+        Inserts a batch of (amount, category, description, date) rows with a single
+        executemany call, all inside one transaction. Amounts and dates are validated first,
+        one bad row raises ValueError and nothing is inserted.
+        '''
+        query = "INSERT INTO transactions(amount_cents, category_id, description, date) VALUES (?, ?, ?, ?)"
+        with timed_query("insert_many") as stats:
+            rows = [(amount_to_cents(amount), category, description, parse_date(date))
+                    for amount, category, description, date in rows]
+            stats.rows = len(rows)
+            with self._pool.writer() as connection:
+                category_ids, new_ids = self._resolve_categories(connection, [row[1] for row in rows])
+                rows = [(amount_cents, category_ids[category], description, date)
+                        for amount_cents, category, description, date in rows]
+                connection.executemany(query, rows)
+                self._update_rollup(connection, rows)
+                self._bump_version(connection)
+        self._category_ids.update(new_ids)
+
+    def _update_rollup(self, connection, rows):
+        '''
+        Adds freshly inserted (amount_cents, category_id, description, date) rows to the
+        (category, day) rollup inside the caller's transaction. Rows are summed per key first,
+        so a batch costs one upsert per key instead of one per row.
+        '''
+        totals = {}
+        for amount_cents, category_id, _, date in rows:
+            key = (category_id, date[:10])
+            total, count = totals.get(key, (0, 0))
+            totals[key] = (total + amount_cents, count + 1)
+
+        query = """
+        INSERT INTO category_daily_totals(category_id, day, total_cents, count) VALUES (?, ?, ?, ?)
+        ON CONFLICT(category_id, day) DO UPDATE SET
+        total_cents = total_cents + excluded.total_cents,
+        count = count + excluded.count
+        """
+        connection.executemany(query, [(category_id, day, total, count) for (category_id, day), (total, count) in totals.items()])
+
+    def _bump_version(self, connection):
+        '''
+        Marks the data as changed, inside the caller's transaction
+        '''
+        connection.execute("UPDATE data_version SET version = version + 1, updated_at = strftime('%s', 'now') WHERE id = 1")
+
+    def get_data_version(self):
+        '''
+        Returns (version, updated_at) where version grows with every write and updated_at
+        is the unix time of the last write
+        '''
+        with timed_query("get_data_version") as stats, self._pool.reader() as connection:
+            stats.rows = 1
+            return connection.execute("SELECT version, updated_at FROM data_version WHERE id = 1").fetchone()
+
+    def _rebuild_rollup(self, connection):
+        '''
+        Recomputes the whole rollup from the transactions table
+        '''
+        connection.execute("DELETE FROM category_daily_totals")
+        connection.execute("""
+        INSERT INTO category_daily_totals(category_id, day, total_cents, count)
+        SELECT category_id, substr(date, 1, 10), SUM(amount_cents), COUNT(*)
+        FROM transactions
+        GROUP BY category_id, substr(date, 1, 10)
+        """)
+
+    def rebuild_rollup(self):
+        '''
+        Throws away the (category, day) rollup and rebuilds it from the raw transactions
+        '''
+        with timed_query("rebuild_rollup"), self._pool.writer() as connection:
+            self._rebuild_rollup(connection)
+            self._bump_version(connection)
+
+    def check_rollup(self):
+        '''
+        Compares the rollup with totals computed from the raw transactions table.
+        Returns a list of (category, day, raw total, raw count, rollup total, rollup count)
+        for every key that disagrees; an empty list means the rollup is consistent.
+        '''
+        query = """
+        WITH raw AS (
+            SELECT category_id, substr(date, 1, 10) AS day, SUM(amount_cents) AS total_cents, COUNT(*) AS count
+            FROM transactions
+            GROUP BY category_id, substr(date, 1, 10)
+        ),
+        mismatches AS (
+            SELECT raw.category_id, raw.day, raw.total_cents AS raw_total, raw.count AS raw_count,
+                   rollup.total_cents AS rollup_total, rollup.count AS rollup_count
+            FROM raw LEFT JOIN category_daily_totals AS rollup USING (category_id, day)
+            WHERE rollup.count IS NULL OR rollup.count != raw.count OR rollup.total_cents != raw.total_cents
+            UNION ALL
+            SELECT rollup.category_id, rollup.day, NULL, NULL, rollup.total_cents, rollup.count
+            FROM category_daily_totals AS rollup LEFT JOIN raw USING (category_id, day)
+            WHERE raw.count IS NULL
+        )
+        SELECT COALESCE(c.name, '#' || m.category_id), m.day, m.raw_total, m.raw_count, m.rollup_total, m.rollup_count
+        FROM mismatches AS m LEFT JOIN categories AS c ON c.id = m.category_id
+        """
+        with timed_query("check_rollup") as stats, self._pool.reader() as connection:
+            rows = connection.execute(query).fetchall()
+            stats.rows = len(rows)
+        return [(category, day, None if raw_total is None else cents_to_amount(raw_total), raw_count,
+                 None if rollup_total is None else cents_to_amount(rollup_total), rollup_count)
+                for category, day, raw_total, raw_count, rollup_total, rollup_count in rows]
+
+    def get_category_totals(self, category=None, start_date=None, end_date=None):
+        '''
+        Retrieves (category, total, count) per category from the rollup, optionally limited
+        to one category and/or a date interval
+        '''
+        conditions, params = filter_conditions(category, start_date and start_date[:10], end_date and end_date[:10],
+                                               date_column="r.day", category_column="r.category_id")
+
+        query = """
+        SELECT c.name, SUM(r.total_cents), SUM(r.count)
+        FROM category_daily_totals AS r JOIN categories AS c ON c.id = r.category_id
+        """
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " GROUP BY c.name ORDER BY c.name"
+        with timed_query("get_category_totals") as stats, self._pool.reader() as connection:
+            rows = connection.execute(query, params).fetchall()
+            stats.rows = len(rows)
+        return [(name, cents_to_amount(total_cents), count) for name, total_cents, count in rows]
+
+    def get_categories(self):
+        '''
+        Returns {category id: name} for every category
+        '''
+        with timed_query("get_categories") as stats, self._pool.reader() as connection:
+            categories = dict(connection.execute("SELECT id, name FROM categories"))
+            stats.rows = len(categories)
+        return categories
+
+    @contextmanager
+    def ledger_columns(self, category=None, start_date=None, end_date=None):
+        '''
+        Opens a read snapshot for bulk analytics and yields (row count, cursor), where the cursor
+        produces (amount_cents, category_id, day number) with day numbers counted from 1970-01-01.
+        Counting and reading happen in the same transaction, so the count matches the rows.
+        Rows whose date SQLite cannot read (left over from before dates were validated) are skipped.
+        '''
+        conditions, params = filter_conditions(category, start_date, end_date)
+        conditions.append("julianday(date) IS NOT NULL")
+        where = " WHERE " + " AND ".join(conditions)
+
+        # The time recorded includes the caller consuming the cursor
+        with timed_query("ledger_columns") as stats, self._pool.reader() as connection:
+            connection.execute("BEGIN")
+            try:
+                count = connection.execute(f"SELECT COUNT(*) FROM transactions{where}", params).fetchone()[0]
+                stats.rows = count
+                cursor = connection.execute(
+                    f"SELECT amount_cents, category_id, CAST(julianday(date) - 2440587.5 AS INTEGER) FROM transactions{where}",
+                    params)
+                yield count, cursor
+                cursor.close()
+            finally:
+                connection.rollback()
 
     def get_transactions(self):
         '''
         Retrieves all transactions from the database
         '''    
-        query = "SELECT * FROM transactions"
-        self._cursor.execute(query)
-        return self._cursor.fetchall()
+        query = TRANSACTION_SELECT
+        with timed_query("get_transactions") as stats, self._pool.reader() as connection:
+            transactions = [_to_transaction(row) for row in connection.execute(query)]
+            stats.rows = len(transactions)
+        return transactions
     
     def get_transactions_by_date(self, start_date, end_date):
         '''
         Retrieve transactions within a specific date range
         '''
-        query = "SELECT * FROM transactions WHERE date BETWEEN ? AND ?"
-        self._cursor.execute(query, (start_date, end_date))
-        return self._cursor.fetchall()
+        query = TRANSACTION_SELECT + " WHERE t.date BETWEEN ? AND ?"
+        with timed_query("get_transactions_by_date") as stats, self._pool.reader() as connection:
+            transactions = [_to_transaction(row) for row in connection.execute(query, (start_date, end_date))]
+            stats.rows = len(transactions)
+        return transactions
     
     def get_transactions_by_category(self, category):
         '''
         Retrieve transactions for a specific category
         '''
-        query = "SELECT * FROM transactions WHERE category = ?"
-        self._cursor.execute(query, (category,))
-        return self._cursor.fetchall()
-    
-    def close_db(self):
+        query = TRANSACTION_SELECT + " WHERE c.name = ?"
+        with timed_query("get_transactions_by_category") as stats, self._pool.reader() as connection:
+            transactions = [_to_transaction(row) for row in connection.execute(query, (category,))]
+            stats.rows = len(transactions)
+        return transactions
+
+    def iter_transactions(self, category=None, start_date=None, end_date=None, chunk_size=DEFAULT_CHUNK_SIZE):
         '''
-        Closes the database connection
+        Yields transactions oldest first, optionally filtered by category and/or a date interval.
+        Rows are fetched chunk_size at a time, so the full result is never held in memory.
         '''
-        self._connection.close()
+        conditions, params = filter_conditions(category, start_date, end_date,
+                                               date_column="t.date", category_column="t.category_id")
 
-    
+        query = TRANSACTION_SELECT
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY t.date, t.id"
+
+        # The time recorded includes the caller consuming the rows (e.g. the PDF report)
+        with timed_query("iter_transactions") as stats, self._pool.reader() as connection:
+            cursor = connection.execute(query, params)
+            try:
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    stats.rows += len(rows)
+                    for row in rows:
+                        yield _to_transaction(row)
+            finally:
+                cursor.close()
+
+    def get_transactions_page(self, page_size=DEFAULT_PAGE_SIZE, after=None, before=None,
+                              category=None, start_date=None, end_date=None, search=None):
+        '''
+        Retrieves one page of transactions, newest first, using a (date, id) keyset.
+        With search text only transactions whose description matches are returned, best
+        match first (see _search_page).
+        "after" continues past the last row of a page, "before" goes back from the first one.
+        Returns a Transaction_Page whose tokens are None when there is no page in that direction.
+        '''
+        page_size = max(1, min(int(page_size), MAX_PAGE_SIZE))
 
+        conditions, params = filter_conditions(category, start_date, end_date,
+                                               date_column="t.date", category_column="t.category_id")
 
+        match = fts_query(search) if search else None
+        if match:
+            return self._search_page(match, page_size, after, before, conditions, params)
 
+        # Walking backwards flips both the comparison and the sort order, the rows are
+        # reversed afterwards so the page is always displayed in the forward order
+        query = TRANSACTION_SELECT
+        backwards = before is not None and after is None
+        if after is not None or backwards:
+            key, row_id = decode_cursor(after if after is not None else before)
+            comparison = "<" if not backwards else ">"
+            conditions.append(f"(t.date, t.id) {comparison} (?, ?)")
+            params.extend((key, row_id))
+
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        direction = "DESC" if not backwards else "ASC"
+        query += f" ORDER BY t.date {direction}, t.id {direction} LIMIT ?"
+
+        # Fetch one extra row to find out whether another page exists without a COUNT(*)
+        with timed_query("get_transactions_page") as stats, self._pool.reader() as connection:
+            rows = connection.execute(query, (*params, page_size + 1)).fetchall()
+            stats.rows = len(rows)
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+
+        if backwards:
+            rows.reverse()
+            has_next, has_prev = True, has_more
+        else:
+            has_next, has_prev = has_more, after is not None
+
+        # Row columns are (id, amount_cents, category, description, date)
+        next_token = encode_cursor(rows[-1][4], rows[-1][0]) if rows and has_next else None
+        prev_token = encode_cursor(rows[0][4], rows[0][0]) if rows and has_prev else None
+        return Transaction_Page([_to_transaction(row) for row in rows], next_token, prev_token)
+
+    def _search_page(self, match, page_size, after, before, conditions, params):
+        '''
+        One page of the transactions matching an FTS5 query, best bm25 rank first.
+        A bm25 rank depends on the whole index, so every write shifts the ranks of all
+        matches and a rank stored in a token would skip or repeat rows. Pages are cut by
+        offset instead, and the tokens ("version|offset") carry the data version of the
+        ranking they belong to; a token from before a later write raises Stale_Cursor_Error.
+        Ranking sorts every match anyway, so skipping the first rows by offset costs little.
+        '''
+        version = None
+        start, limit = 0, page_size + 1
+        backwards = before is not None and after is None
+        if after is not None or backwards:
+            version, offset = decode_cursor(after if after is not None else before)
+            version = int(version)
+            if offset < 0:
+                raise ValueError(f"Invalid cursor token: {after if after is not None else before!r}")
+            if backwards:
+                start = max(0, offset - page_size)
+                limit = offset - start
+            else:
+                start = offset
+
+        # bm25 ranks are negative, the smaller the better
+        query = """
+        SELECT t.id, t.amount_cents, c.name, t.description, t.date
+        FROM (SELECT rowid AS id, rank FROM transactions_fts WHERE transactions_fts MATCH ?) AS hits
+        JOIN transactions AS t ON t.id = hits.id
+        JOIN categories AS c ON c.id = t.category_id
+        """
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY hits.rank, t.id LIMIT ? OFFSET ?"
+
+        with timed_query("search_transactions_page") as stats, self._pool.reader() as connection:
+            # The version and the matches come from the same read snapshot
+            connection.execute("BEGIN")
+            try:
+                current = connection.execute("SELECT version FROM data_version WHERE id = 1").fetchone()[0]
+                if version is not None and version != current:
+                    raise Stale_Cursor_Error("The transactions changed since this page was shown")
+                rows = connection.execute(query, (match, *params, limit, start)).fetchall()
+            finally:
+                connection.rollback()
+            stats.rows = len(rows)
+
+        if backwards:
+            has_next, has_prev = True, start > 0
+        else:
+            has_next, has_prev = len(rows) > page_size, start > 0
+            rows = rows[:page_size]
+
+        next_token = encode_cursor(current, start + len(rows)) if rows and has_next else None
+        prev_token = encode_cursor(current, start) if rows and has_prev else None
+        return Transaction_Page([_to_transaction(row) for row in rows], next_token, prev_token)
+
+    def close_db(self):
+        '''
+        Closes every pooled database connection
+        '''
+        self._pool.close()
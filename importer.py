@@ -0,0 +1,189 @@
+'''
+Author - Abdulmuid Olaniyan
+Purpose - Streams bank statements (CSV or OFX) into the database in batches
+'''
+import csv
+import html
+import re
+
+from database import amount_to_cents, cents_to_amount, parse_date
+
+# Rows handed to one executemany call (and committed as one transaction)
+DEFAULT_BATCH_SIZE = 1000
+MAX_BATCH_SIZE = 50000
+
+# Only the first few rejected rows are described in the result, a badly broken file
+# must not turn the report into a second copy of the upload
+MAX_REPORTED_ERRORS = 100
+
+# Category given to OFX transactions, the format has no notion of a spending category
+DEFAULT_OFX_CATEGORY = "Imported"
+
+# Size of the pieces an OFX stream is read in
+OFX_READ_SIZE = 64 * 1024
+
+OFX_TOKEN = re.compile(r"<([^<>]+)>([^<]*)")
+
+
+class Import_Result():
+    '''
+    Running tally of an import: how many rows went in and why the others did not
+    '''
+    def __init__(self):
+        self.accepted = 0
+        self.rejected = 0
+        self.errors = []
+
+    def reject(self, line, reason):
+        '''
+        Counts a rejected row and remembers the reason while there is room for it
+        '''
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": reason})
+
+    def to_dict(self):
+        return {"accepted": self.accepted, "rejected": self.rejected, "errors": self.errors}
+
+
+def iter_csv_rows(stream):
+    '''
+    Yields (line number, fields) for every record of a CSV statement, or (line number,
+    {"error": reason}) for a record the csv module cannot parse.
+    The header must name at least the amount, category and date columns; description is optional.
+    '''
+    reader = csv.DictReader(stream)
+    try:
+        fieldnames = reader.fieldnames
+    except csv.Error as error:
+        raise ValueError(f"Malformed CSV header: {error}") from None
+    if fieldnames is None:
+        return
+    columns = {name.strip().lower(): name for name in fieldnames if name}
+    missing = [name for name in ("amount", "category", "date") if name not in columns]
+    if missing:
+        raise ValueError(f"CSV header is missing column(s): {', '.join(missing)}")
+
+    while True:
+        try:
+            record = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as error:
+            # e.g. a field over csv.field_size_limit(); the record is rejected and reading goes
+            # on with the next line. DictReader only copies line_num after a successful read.
+            yield reader.reader.line_num, {"error": f"malformed CSV record: {error}"}
+            continue
+        yield reader.line_num, {
+            "amount": record.get(columns["amount"]),
+            "category": record.get(columns["category"]),
+            "description": record.get(columns.get("description", ""), ""),
+            "date": record.get(columns["date"]),
+        }
+
+
+def _ofx_fields(values, category):
+    '''
+    Turns the tag values of one <STMTTRN> block into raw row fields
+    '''
+    description = " - ".join(part for part in (values.get("NAME"), values.get("MEMO")) if part)
+    return {
+        "amount": values.get("TRNAMT"),
+        "category": category,
+        "description": description,
+        "date": values.get("DTPOSTED"),
+    }
+
+
+def iter_ofx_rows(stream, category=DEFAULT_OFX_CATEGORY):
+    '''
+    Yields (transaction number, fields) for every <STMTTRN> block of an OFX statement.
+    Works for both SGML (unclosed tags) and XML flavoured files and reads the stream in
+    fixed-size pieces, so the whole file is never held in memory.
+    A block that is never closed ends where the next one starts, or with the transaction
+    list, so it is still imported (or rejected) rather than lost.
+    '''
+    count = 0
+    current = None
+    buffer = ""
+    while True:
+        chunk = stream.read(OFX_READ_SIZE)
+        buffer += chunk
+        # Only tokens followed by another "<" are known to be complete
+        end = len(buffer) if not chunk else buffer.rfind("<")
+        if end <= 0:
+            if not chunk:
+                break
+            continue
+
+        for match in OFX_TOKEN.finditer(buffer, 0, end):
+            tag = match.group(1).strip().upper()
+            if current is not None and tag in ("STMTTRN", "/STMTTRN", "/BANKTRANLIST"):
+                count += 1
+                yield count, _ofx_fields(current, category)
+                current = None
+            if tag == "STMTTRN":
+                current = {}
+            elif current is not None and not tag.startswith("/"):
+                # Values may carry SGML/XML entities such as &amp;
+                current[tag] = html.unescape(match.group(2).strip())
+        buffer = buffer[end:]
+
+        if not chunk:
+            break
+
+    if current is not None:
+        count += 1
+        yield count, _ofx_fields(current, category)
+
+
+def validate_row(fields):
+    '''
+    Turns raw parsed fields into an (amount, category, description, date) row; raises ValueError
+    '''
+    if "error" in fields:
+        raise ValueError(fields["error"])
+    if fields["amount"] in (None, ""):
+        raise ValueError("missing amount")
+    if fields["date"] in (None, ""):
+        raise ValueError("missing date")
+    category = (fields["category"] or "").strip()
+    if not category:
+        raise ValueError("missing category")
+    description = (fields["description"] or "").strip()
+    # Same amount rules as /add_transaction; the exact Decimal goes on to insert_many
+    amount = cents_to_amount(amount_to_cents(fields["amount"]))
+    return amount, category, description, parse_date(fields["date"])
+
+
+def import_transactions(db, stream, file_format="csv", batch_size=DEFAULT_BATCH_SIZE,
+                        category=DEFAULT_OFX_CATEGORY):
+    '''
+    Parses a text stream and inserts the valid rows in batches of batch_size, one transaction per batch.
+    Returns an Import_Result describing how many rows were accepted and rejected.
+    '''
+    if file_format == "csv":
+        records = iter_csv_rows(stream)
+    elif file_format == "ofx":
+        records = iter_ofx_rows(stream, category)
+    else:
+        raise ValueError(f"Unsupported import format: {file_format!r}")
+    batch_size = max(1, min(int(batch_size), MAX_BATCH_SIZE))
+
+    result = Import_Result()
+    batch = []
+    for line, fields in records:
+        try:
+            batch.append(validate_row(fields))
+        except ValueError as error:
+            result.reject(line, str(error))
+            continue
+        if len(batch) >= batch_size:
+            db.insert_many(batch)
+            result.accepted += len(batch)
+            batch = []
+
+    if batch:
+        db.insert_many(batch)
+        result.accepted += len(batch)
+    return result
@@ -0,0 +1,222 @@
+'''
+Author - Abdulmuid Olaniyan
+Purpose - In-process performance metrics (Prometheus text format) and an optional sampling profiler
+Every worker process keeps its own numbers, scrape each worker (or run a single one) to see them all.
+'''
+import sys
+import threading
+import time
+import traceback
+from collections import Counter as Stack_Counter
+from contextlib import contextmanager
+
+# Upper bounds (in seconds) of the latency histogram buckets
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter():
+    '''
+    A monotonically increasing value per label combination
+    '''
+    kind = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, _format_labels(self.labelnames, key), value) for key, value in sorted(self._values.items())]
+
+
+class Histogram():
+    '''
+    Counts observations into cumulative buckets per label combination, plus their sum and count
+    '''
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    labels = _format_labels(self.labelnames, key, f'le="{_format_number(bound)}"')
+                    samples.append((f"{self.name}_bucket", labels, cumulative))
+                labels = _format_labels(self.labelnames, key)
+                samples.append((f"{self.name}_sum", labels, total))
+                samples.append((f"{self.name}_count", labels, cumulative))
+        return samples
+
+
+class Registry():
+    '''
+    The set of metrics rendered by /metrics
+    '''
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self, gauges=None):
+        '''
+        Renders every metric in the Prometheus text exposition format. gauges is an optional
+        {name: (help text, value)} of point-in-time values computed by the caller.
+        '''
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_format_number(value)}")
+        for name, (help_text, value) in (gauges or {}).items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {_format_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "finance_http_request_duration_seconds", "Time spent handling a request, by route", ("route", "method", "status")))
+QUERY_SECONDS = REGISTRY.register(Histogram(
+    "finance_db_query_duration_seconds", "Time spent in a Database_Manager call", ("query",)))
+QUERY_ROWS = REGISTRY.register(Counter(
+    "finance_db_rows_total", "Rows read or written by Database_Manager calls", ("query",)))
+RENDER_SECONDS = REGISTRY.register(Histogram(
+    "finance_render_duration_seconds", "Time spent rendering a chart or a PDF report", ("kind",)))
+RENDER_BYTES = REGISTRY.register(Counter(
+    "finance_render_bytes_total", "Bytes of rendered charts and PDF reports", ("kind",)))
+CHART_CACHE_LOOKUPS = REGISTRY.register(Counter(
+    "finance_chart_cache_lookups_total", "Chart cache lookups, by result (hit or miss)", ("result",)))
+
+
+class Query_Stats():
+    '''
+    Filled in by the body of a timed_query block: the number of rows the call read or wrote
+    '''
+    __slots__ = ("rows",)
+
+    def __init__(self):
+        self.rows = 0
+
+
+@contextmanager
+def timed_query(name):
+    '''
+    Records how long the with block takes as the database call name, together with the
+    row count the block stores on the yielded Query_Stats; failed calls are recorded too
+    '''
+    stats = Query_Stats()
+    started = time.perf_counter()
+    try:
+        yield stats
+    finally:
+        QUERY_SECONDS.observe(time.perf_counter() - started, query=name)
+        QUERY_ROWS.inc(stats.rows, query=name)
+
+
+class Sampling_Profiler():
+    '''
+    Periodically samples the stacks of the threads doing work (marked with track) and counts
+    them, which shows where requests spend their time with little overhead. Idle worker
+    threads are left out, their waiting stacks would drown everything else. Results are in
+    the "collapsed stacks" format understood by flamegraph.pl and speedscope.
+    '''
+    def __init__(self, interval=0.01, max_depth=40):
+        self._interval = interval
+        self._max_depth = max_depth
+        self._stacks = Stack_Counter()
+        self._tracked = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        '''
+        Starts the sampling thread unless it already runs in this process
+        '''
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+
+    def track(self):
+        '''
+        Samples the calling thread until it calls untrack
+        '''
+        with self._lock:
+            self._tracked.add(threading.get_ident())
+
+    def untrack(self):
+        with self._lock:
+            self._tracked.discard(threading.get_ident())
+
+    def _run(self):
+        while True:
+            time.sleep(self._interval)
+            with self._lock:
+                tracked = list(self._tracked)
+            frames = sys._current_frames()
+            for thread_id in tracked:
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                stack = traceback.extract_stack(frame, limit=self._max_depth)
+                key = ";".join(f"{entry.name} ({entry.filename.rsplit('/', 1)[-1]}:{entry.lineno})" for entry in stack)
+                with self._lock:
+                    self._stacks[key] += 1
+
+    def collapsed(self, limit=200):
+        '''
+        Returns the most frequent stacks as "frame;frame;frame count" lines
+        '''
+        with self._lock:
+            return "".join(f"{stack} {count}\n" for stack, count in self._stacks.most_common(limit))
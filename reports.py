@@ -0,0 +1,124 @@
+'''
+Author - Abdulmuid Olaniyan
+Purpose - Builds the multi-page PDF transaction report
+This module is heavy to import, app.py only loads it when the first PDF is exported.
+'''
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+
+# Column x positions and widths (in points) of the transaction table
+COLUMNS = [("ID", 50, 45), ("Amount", 100, 95), ("Category", 200, 145), ("Description", 350, 145), ("Date", 500, 70)]
+
+ROW_HEIGHT = 18
+BOTTOM_MARGIN = 72
+FONT = "Helvetica"
+BOLD_FONT = "Helvetica-Bold"
+FONT_SIZE = 10
+
+
+def _fit(text, width, font=FONT, size=FONT_SIZE):
+    '''
+    Shortens text with an ellipsis so it does not run into the next column
+    '''
+    text = "" if text is None else str(text)
+    # No Helvetica glyph is wider than 1.1 times the font size, so short strings can skip measuring
+    if len(text) * size * 1.1 <= width or stringWidth(text, font, size) <= width:
+        return text
+    while text and stringWidth(text + "...", font, size) > width:
+        text = text[:-1]
+    return text + "..."
+
+
+def _format_amount(amount):
+    return f"{amount:,.2f}"
+
+
+class Transaction_Report():
+    '''
+    Draws transactions onto a reportlab canvas one row at a time.
+    Every page repeats the title and column headers and ends with the total of its rows,
+    the last page also carries the grand total.
+    '''
+    def __init__(self, output, title="Transaction History"):
+        self._canvas = canvas.Canvas(output, pagesize=letter, pageCompression=1)
+        self._width, self._height = letter
+        self._title = title
+        self._page_number = 0
+        self._page_total = 0
+        self._grand_total = 0
+        self._row_count = 0
+        self._y_position = 0
+        self._start_page()
+
+    def _start_page(self):
+        '''
+        Draws the title and table headers at the top of a fresh page
+        '''
+        self._page_number += 1
+        self._page_total = 0
+        c = self._canvas
+
+        # Add a title
+        c.setFont(BOLD_FONT, 16)
+        c.drawString(200, self._height - 50, self._title)
+
+        # Add the table headers
+        c.setFont(BOLD_FONT, 12)
+        for header, x, _ in COLUMNS:
+            c.drawString(x, self._height - 100, header)
+
+        c.setFont(FONT, FONT_SIZE)
+        self._y_position = self._height - 120
+
+    def _finish_page(self, last=False):
+        '''
+        Writes the page total and page number at the bottom of the current page,
+        plus the grand total on the last page
+        '''
+        c = self._canvas
+        c.setFont(BOLD_FONT, FONT_SIZE)
+        c.drawString(50, BOTTOM_MARGIN - 20, f"Page total: {_format_amount(self._page_total)}")
+        if last:
+            c.drawRightString(self._width - 50, BOTTOM_MARGIN - 20,
+                              f"Grand total: {_format_amount(self._grand_total)} ({self._row_count} transactions)")
+        c.setFont(FONT, 8)
+        c.drawRightString(self._width - 50, BOTTOM_MARGIN - 40, f"Page {self._page_number}")
+
+    def add_row(self, transaction):
+        '''
+        Draws one (id, amount, category, description, date) row, starting a new page when this one is full
+        '''
+        if self._y_position < BOTTOM_MARGIN:
+            self._finish_page()
+            self._canvas.showPage()
+            self._start_page()
+
+        c = self._canvas
+        row_id, amount, category, description, date = transaction
+        values = [row_id, _format_amount(amount), category, description, date]
+        for value, (_, x, width) in zip(values, COLUMNS):
+            c.drawString(x, self._y_position, _fit(value, width))
+        self._y_position -= ROW_HEIGHT
+
+        self._page_total += amount
+        self._grand_total += amount
+        self._row_count += 1
+
+    def finish(self):
+        '''
+        Adds the grand total and writes out the document
+        '''
+        self._finish_page(last=True)
+        self._canvas.save()
+
+
+def write_transaction_pdf(transactions, output):
+    '''
+    Writes the transactions (any iterable of rows, e.g. Database_Manager.iter_transactions())
+    as a paginated PDF report to output, a path or binary file object
+    '''
+    report = Transaction_Report(output)
+    for transaction in transactions:
+        report.add_row(transaction)
+    report.finish()
@@ -0,0 +1,292 @@
+'''
+Author - Abdulmuid Olaniyan
+Purpose - Self-checking tester for the parts of the database layer that are easy to break
+and hard to notice: the one-time migration to integer cents, keyset paging in both
+directions, the chunked OFX parser, malformed CSV records and the rollup consistency check.
+Every check runs against throwaway databases. Run it with:  python tester_checks.py
+'''
+import io
+import os
+import sqlite3
+import tempfile
+from decimal import Decimal
+
+import importer
+from database import Database_Manager, Stale_Cursor_Error
+
+# The original layout: REAL amounts, category names stored on every row, and the
+# name-keyed rollup and indexes of the versions that came before integer cents
+OLD_SCHEMA = """
+CREATE TABLE transactions(
+id INTEGER PRIMARY KEY AUTOINCREMENT,
+amount REAL NOT NULL,
+category TEXT NOT NULL,
+description TEXT,
+date TEXT NOT NULL
+);
+CREATE INDEX idx_transactions_date ON transactions(date, id);
+CREATE INDEX idx_transactions_category ON transactions(category);
+CREATE INDEX idx_transactions_category_date ON transactions(category, date, id);
+CREATE TABLE category_daily_totals(
+category TEXT NOT NULL,
+day TEXT NOT NULL,
+total REAL NOT NULL,
+count INTEGER NOT NULL,
+PRIMARY KEY (category, day)
+) WITHOUT ROWID;
+"""
+
+# (id, amount, category, description, date) -> expected cents. Row 4 was deleted, so ids
+# have a gap; the amounts are the ones binary floating point gets wrong
+OLD_ROWS = [
+    ((1, 0.285, "Food", "Lunch at the canteen", "2024-01-05"), 29),
+    ((2, 1200, "Rent", None, "2024-01-05"), 120000),
+    ((3, 1.005, "Food", "Coffee beans", "2024-01-06"), 101),
+    ((5, 0.1 + 0.2, "Transport", "Bus ticket", "2024-01-06"), 30),
+    ((6, -19.99, "Food", "Refund coffee", "2024-02-01"), -1999),
+    ((7, "7.5", "Transport", "Train", "2024-02-01"), 750),
+]
+
+
+def build_old_database(path, rows):
+    connection = sqlite3.connect(path)
+    connection.executescript(OLD_SCHEMA)
+    connection.executemany("INSERT INTO transactions(id, amount, category, description, date) VALUES (?, ?, ?, ?, ?)", rows)
+    connection.execute("""
+    INSERT INTO category_daily_totals(category, day, total, count)
+    SELECT category, date, SUM(amount), COUNT(*) FROM transactions GROUP BY category, date
+    """)
+    connection.commit()
+    connection.close()
+
+
+def fts_rows(db, text):
+    with db._pool.reader() as connection:
+        return sorted(row[0] for row in connection.execute(
+            "SELECT rowid FROM transactions_fts WHERE transactions_fts MATCH ?", (text,)))
+
+
+def check_migration(workdir):
+    '''
+    An old REAL/TEXT database is converted to cents with every row id, the rollup and
+    the search index intact
+    '''
+    path = os.path.join(workdir, "old.db")
+    build_old_database(path, [row for row, _ in OLD_ROWS])
+    db = Database_Manager(path)
+
+    expected = [(row_id, Decimal(cents).scaleb(-2), category, description, date)
+                for (row_id, _, category, description, date), cents in OLD_ROWS]
+    assert db.get_transactions() == expected, db.get_transactions()
+
+    with db._pool.reader() as connection:
+        columns = [column[1] for column in connection.execute("PRAGMA table_info(transactions)")]
+        indexes = {row[0] for row in connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'transactions'")}
+        leftovers = connection.execute("SELECT name FROM sqlite_master WHERE name = 'transactions_real'").fetchall()
+    assert columns == ["id", "amount_cents", "category_id", "description", "date"], columns
+    assert indexes == {"idx_transactions_date", "idx_transactions_category_date"}, indexes
+    assert leftovers == []
+
+    # The rollup is rebuilt in cents from the converted rows
+    assert db.check_rollup() == []
+    assert db.get_category_totals() == [("Food", Decimal("-18.69"), 3), ("Rent", Decimal("1200.00"), 1),
+                                        ("Transport", Decimal("7.80"), 2)], db.get_category_totals()
+
+    # The search index covers the migrated descriptions
+    assert fts_rows(db, "coffee") == [3, 6]
+    assert fts_rows(db, '"can"*') == [1]
+    with db._pool.writer() as connection:
+        connection.execute("INSERT INTO transactions_fts(transactions_fts) VALUES ('integrity-check')")
+
+    # New rows continue after the highest old id, and opening again changes nothing
+    db.insert_transactions("2.50", "Food", "Tea", "2024-03-01")
+    assert db.get_transactions()[-1][0] == 8
+    db.close_db()
+    db = Database_Manager(path)
+    assert len(db.get_transactions()) == len(OLD_ROWS) + 1
+    assert db.check_rollup() == []
+    db.close_db()
+
+
+def check_failed_migration(workdir):
+    '''
+    A row that cannot be converted stops the migration and leaves the old database as it was
+    '''
+    path = os.path.join(workdir, "broken.db")
+    build_old_database(path, [(1, 12.5, "Food", "Lunch", "2024-01-05"), (2, "twelve", "Food", "Dinner", "2024-01-05")])
+    try:
+        Database_Manager(path)
+    except ValueError as error:
+        assert "transaction 2" in str(error), error
+    else:
+        raise AssertionError("migrating an unconvertible amount should fail")
+
+    connection = sqlite3.connect(path)
+    columns = [column[1] for column in connection.execute("PRAGMA table_info(transactions)")]
+    rows = connection.execute("SELECT id, amount FROM transactions ORDER BY id").fetchall()
+    connection.close()
+    assert columns == ["id", "amount", "category", "description", "date"], columns
+    assert rows == [(1, 12.5), (2, "twelve")], rows
+
+
+def walk(db, page_size, **filters):
+    '''
+    Follows the "after" tokens to the last page, then the "before" tokens back to the first.
+    Returns (pages going forward, pages going back), each page a list of ids.
+    '''
+    forward = []
+    page = db.get_transactions_page(page_size, **filters)
+    assert page.prev_token is None
+    while True:
+        forward.append([row[0] for row in page.rows])
+        if page.next_token is None:
+            break
+        page = db.get_transactions_page(page_size, after=page.next_token, **filters)
+
+    backward = [forward[-1]]
+    while page.prev_token is not None:
+        page = db.get_transactions_page(page_size, before=page.prev_token, **filters)
+        backward.append([row[0] for row in page.rows])
+    return forward, backward[::-1]
+
+
+def check_paging(workdir):
+    '''
+    Keyset pages cover every row exactly once in (date, id) order, and walking back
+    gives the same pages; rows sharing a date must not be skipped or repeated.
+    Search pages cover every match once, also when a write lands between two pages.
+    '''
+    db = Database_Manager(os.path.join(workdir, "paging.db"))
+    db.insert_many((f"{i}.00", ("Food", "Rent")[i % 2], f"Coffee shop {i}" if i % 3 else f"Train {i}",
+                    f"2024-01-{i % 4 + 1:02d}") for i in range(23))
+    rows = db.get_transactions()
+
+    everything = [row[0] for row in sorted(rows, key=lambda row: (row[4], row[0]), reverse=True)]
+    forward, backward = walk(db, 5)
+    assert sum(forward, []) == everything, forward
+    assert [len(page) for page in forward] == [5, 5, 5, 5, 3]
+    assert backward == forward, backward
+
+    food = [row[0] for row in sorted(rows, key=lambda row: (row[4], row[0]), reverse=True) if row[2] == "Food"]
+    forward, backward = walk(db, 4, category="Food")
+    assert sum(forward, []) == food
+    assert backward == forward
+
+    # Ranked search pages: every match once, and the same pages going back
+    matches = fts_rows(db, '"coffee"*')
+    forward, backward = walk(db, 4, search="coffee")
+    assert sorted(sum(forward, [])) == matches
+    assert backward == forward
+
+    # A write reorders every bm25 rank: a search token from before it is refused instead of
+    # skipping matches, and paging again from the start finds every match once
+    page = db.get_transactions_page(4, search="coffee")
+    db.insert_transactions("1.00", "Food", "Coffee to go", "2024-01-02")
+    for token in ({"after": page.next_token}, {"before": page.next_token}):
+        try:
+            db.get_transactions_page(4, search="coffee", **token)
+        except Stale_Cursor_Error:
+            pass
+        else:
+            raise AssertionError("a search token from before a write should be refused")
+    forward, backward = walk(db, 4, search="coffee")
+    assert sorted(sum(forward, [])) == fts_rows(db, '"coffee"*') == sorted(matches + [db.get_transactions()[-1][0]])
+    assert backward == forward
+
+    # Nothing is older than a token from before the first transaction
+    assert db.get_transactions_page(5, after="1999-01-01|1").rows == []
+    db.close_db()
+
+
+OFX_STATEMENT = """OFXHEADER:100
+DATA:OFXSGML
+
+<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>
+<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20240105120000[0:GMT]<TRNAMT>-12.50<NAME>Corner shop<MEMO>Milk
+<STMTTRN><TRNTYPE>CREDIT<DTPOSTED>20240106<TRNAMT>1,250.00<NAME>Salary</STMTTRN>
+<STMTTRN>
+  <TRNTYPE>DEBIT</TRNTYPE>
+  <DTPOSTED>20240107</DTPOSTED>
+  <TRNAMT>-3.20</TRNAMT>
+  <NAME>Bakery &amp; cafe</NAME>
+</STMTTRN>
+</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>
+"""
+
+
+def check_ofx_chunks():
+    '''
+    The OFX parser gives the same transactions wherever the read boundaries fall,
+    down to one character at a time
+    '''
+    expected = list(importer.iter_ofx_rows(io.StringIO(OFX_STATEMENT)))
+    # The first block is never closed, it ends where the second one starts
+    assert [(fields["amount"], fields["description"]) for _, fields in expected] == [
+        ("-12.50", "Corner shop - Milk"), ("1,250.00", "Salary"), ("-3.20", "Bakery & cafe")], expected
+
+    # A block left open at the end of the transaction list, or of the file, is not lost
+    unclosed = "<BANKTRANLIST><STMTTRN><TRNAMT>1.00<DTPOSTED>20240101<STMTTRN><TRNAMT>2.00<DTPOSTED>20240102"
+    for statement in (unclosed + "</BANKTRANLIST>", unclosed):
+        rows = list(importer.iter_ofx_rows(io.StringIO(statement)))
+        assert [fields["amount"] for _, fields in rows] == ["1.00", "2.00"], rows
+
+    read_size = importer.OFX_READ_SIZE
+    try:
+        for size in range(1, len(OFX_STATEMENT) + 2):
+            importer.OFX_READ_SIZE = size
+            assert list(importer.iter_ofx_rows(io.StringIO(OFX_STATEMENT))) == expected, size
+    finally:
+        importer.OFX_READ_SIZE = read_size
+
+
+def check_csv_errors(workdir):
+    '''
+    A record the csv module cannot parse (here a field over its size limit) is rejected
+    and the import carries on with the next line
+    '''
+    db = Database_Manager(os.path.join(workdir, "csv.db"))
+    statement = ("amount,category,description,date\n1.00,Food,Tea,2024-01-01\n"
+                 f"2.00,Food,{'x' * 200_000},2024-01-02\n3.00,Food,Milk,2024-01-03\n")
+    result = importer.import_transactions(db, io.StringIO(statement), batch_size=1)
+    assert (result.accepted, result.rejected) == (2, 1), result.to_dict()
+    assert result.errors[0]["line"] == 3 and "malformed CSV" in result.errors[0]["error"], result.errors
+    assert [row[3] for row in db.get_transactions()] == ["Tea", "Milk"]
+    db.close_db()
+
+
+def check_rollup(workdir):
+    '''
+    check_rollup finds a rollup that disagrees with the transactions, and rebuild_rollup repairs it
+    '''
+    db = Database_Manager(os.path.join(workdir, "rollup.db"))
+    db.insert_many([("10.00", "Food", "Lunch", "2024-01-05"), ("2.25", "Food", "Tea", "2024-01-05"),
+                    ("800", "Rent", "", "2024-01-01")])
+    assert db.check_rollup() == []
+
+    with db._pool.writer() as connection:
+        connection.execute("UPDATE category_daily_totals SET total_cents = total_cents + 1 WHERE day = '2024-01-05'")
+        connection.execute("DELETE FROM category_daily_totals WHERE day = '2024-01-01'")
+        connection.execute("""
+        INSERT INTO category_daily_totals(category_id, day, total_cents, count)
+        SELECT id, '2024-02-01', 5, 1 FROM categories WHERE name = 'Food'
+        """)
+    mismatches = sorted(db.check_rollup(), key=lambda row: row[1])
+    assert mismatches == [
+        ("Rent", "2024-01-01", Decimal("800.00"), 1, None, None),
+        ("Food", "2024-01-05", Decimal("12.25"), 2, Decimal("12.26"), 2),
+        ("Food", "2024-02-01", None, None, Decimal("0.05"), 1),
+    ], mismatches
+
+    db.rebuild_rollup()
+    assert db.check_rollup() == []
+    db.close_db()
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as workdir:
+        for check in (check_migration, check_failed_migration, check_paging, check_csv_errors, check_rollup):
+            check(workdir)
+            print(f"{check.__name__}: ok")
+    check_ofx_chunks()
+    print("check_ofx_chunks: ok")
@@ -0,0 +1,6 @@
+'''
+Production entry point, e.g.:  gunicorn --preload --workers 4 --bind 0.0.0.0:5000 wsgi:app
+'''
+from app import create_app
+
+app = create_app()